@@ -3,13 +3,13 @@ import os
 from pathlib import Path
 from click import prompt
 from dotenv import load_dotenv
-from langchain.agents import Tool
+from langchain_core.tools import StructuredTool
 from agents.tools import get_folder_structure, list_directory
-from models.migration import MigrationResult, PathInputSchema
+from models.migration import MigrationResult, ListDirectoryInputSchema, FolderStructureInputSchema
 from utils.file_utils import prepare_download_links
 import asyncio
 from langgraph.prebuilt import create_react_agent
-from langchain_openai import AzureChatOpenAI
+from langchain_openai import AzureChatOpenAI, ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from pydantic import BaseModel
 import logging
@@ -32,33 +32,68 @@ def log_tool_call(tool_name, func):
     return wrapper
 
 tools = [
-    Tool(
+    StructuredTool.from_function(
         name="list_directory",
         func=log_tool_call("list_directory", list_directory),
-        description="Lists the contents of a directory. Provide the full path to the directory.",
-        input_schema=PathInputSchema
+        description=(
+            "Lists the contents of a directory with entry counts for subdirectories. Provide the full path to the "
+            "directory; use offset to page through long listings."
+        ),
+        args_schema=ListDirectoryInputSchema
     ),
-    Tool(
+    StructuredTool.from_function(
         name="get_folder_structure",
         func=log_tool_call("get_folder_structure", get_folder_structure),
-        description="Gets the folder structure of a directory. Provide the full path to the directory.",
-        input_schema=PathInputSchema
+        description=(
+            "Gets the folder structure of a directory as an indented tree, skipping dependency and build folders. "
+            "Provide the full path to the directory; call it again on a subdirectory to see deeper levels."
+        ),
+        args_schema=FolderStructureInputSchema
     ),
 ]
 
-llm = AzureChatOpenAI(
-    deployment_name=DEPLOYMENT_NAME,
-    api_key=AZURE_OPENAI_API_KEY,
-    openai_api_version=AZURE_OPENAI_API_VERSION,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    temperature=1
-)
-
 prompt = "You are a helpful AI assistant. You can use the following tools to answer questions"
-agent = create_react_agent(
-    llm,
-    tools,
-    prompt=prompt
-)
 
-logger.info("Azure OpenAI agent and tools initialized.")
\ No newline at end of file
+
+def default_deployment_config():
+    """The single deployment described by the DEPLOYMENT_NAME / AZURE_OPENAI_* variables."""
+    return {
+        "name": DEPLOYMENT_NAME or "default",
+        "kind": "azure",
+        "deployment": DEPLOYMENT_NAME,
+        "endpoint": AZURE_OPENAI_ENDPOINT,
+        "api_key": AZURE_OPENAI_API_KEY,
+        "api_version": AZURE_OPENAI_API_VERSION,
+    }
+
+
+def build_chat_model(config):
+    """Chat model for one deployment config: Azure OpenAI, or any OpenAI-compatible server with kind "openai"."""
+    # The pool fails over and invoke_with_retries backs off, so the client itself should not retry.
+    max_retries = config.get("max_retries", 0)
+    if config.get("kind", "azure") == "openai":
+        return ChatOpenAI(
+            model=config.get("model") or config.get("deployment"),
+            base_url=config.get("base_url") or config.get("endpoint"),
+            api_key=config.get("api_key") or "not-needed",
+            temperature=config.get("temperature", 1),
+            max_retries=max_retries
+        )
+    return AzureChatOpenAI(
+        deployment_name=config.get("deployment"),
+        api_key=config.get("api_key"),
+        openai_api_version=config.get("api_version"),
+        azure_endpoint=config.get("endpoint"),
+        temperature=config.get("temperature", 1),
+        max_retries=max_retries
+    )
+
+
+def build_agent(chat_model):
+    agent = create_react_agent(
+        chat_model,
+        tools,
+        prompt=prompt
+    )
+    logger.info("Agent and tools initialized.")
+    return agent
\ No newline at end of file
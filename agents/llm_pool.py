@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from agents.azureopenai_agent import build_agent, build_chat_model, default_deployment_config
+
+logger = logging.getLogger(__name__)
+
+# JSON list of deployment configs, e.g.
+# [{"name": "east", "deployment": "gpt-4o", "endpoint": "https://east.openai.azure.com/", "api_key": "...",
+#   "api_version": "2024-06-01"},
+#  {"name": "local", "kind": "openai", "base_url": "http://127.0.0.1:8001/v1", "model": "fake"}]
+# When unset, the single deployment from DEPLOYMENT_NAME / AZURE_OPENAI_* is used.
+LLM_DEPLOYMENTS = os.getenv("LLM_DEPLOYMENTS")
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "3"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError"}
+
+
+def is_retryable(error):
+    """Errors that say the deployment is overloaded or down (429, 5xx, timeouts), as opposed to a bad request."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+class Deployment:
+    """One model endpoint with its own lazily built clients, load and circuit breaker state.
+
+    chat_model and agent can be passed in directly (e.g. fakes in benchmarks); otherwise they are built
+    from config on first use.
+    """
+
+    def __init__(self, name, config=None, chat_model=None, agent=None):
+        self.name = name
+        self.config = config or {}
+        self.model_name = self.config.get("model") or self.config.get("deployment") or name
+        self._chat_model = chat_model
+        self._agent = agent
+        self._structured = {}
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.failures = 0
+        self.open_until = 0.0
+
+    def get_chat_model(self):
+        with self._lock:
+            if self._chat_model is None:
+                self._chat_model = build_chat_model(self.config)
+                logger.info("Initialized chat model for deployment %s", self.name)
+            return self._chat_model
+
+    def get_structured_llm(self, schema):
+        chat_model = self.get_chat_model()
+        with self._lock:
+            if schema not in self._structured:
+                self._structured[schema] = chat_model.with_structured_output(schema)
+            return self._structured[schema]
+
+    def get_agent(self):
+        chat_model = self.get_chat_model()
+        with self._lock:
+            if self._agent is None:
+                self._agent = build_agent(chat_model)
+            return self._agent
+
+    def available(self, now):
+        # Once the cooldown has passed the breaker is half-open: calls go through, and one more failure reopens it.
+        return self.open_until <= now
+
+    def record_success(self):
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= LLM_BREAKER_THRESHOLD:
+            self.open_until = time.monotonic() + LLM_BREAKER_COOLDOWN
+            logger.warning("Circuit opened for deployment %s after %d failures", self.name, self.failures)
+
+
+class LLMPool:
+    """Routes each call to the least-loaded available deployment and fails over on 429/5xx errors."""
+
+    def __init__(self, deployments):
+        if not deployments:
+            raise ValueError("LLMPool needs at least one deployment")
+        self.deployments = list(deployments)
+        # Part of cache keys: results are reusable across deployments of the same models.
+        self.model_name = ",".join(sorted({deployment.model_name for deployment in self.deployments}))
+
+    def _pick(self, tried):
+        now = time.monotonic()
+        candidates = [d for d in self.deployments if d.name not in tried and d.available(now)]
+        if not candidates:
+            return None
+        # min() keeps configuration order among equally loaded deployments.
+        return min(candidates, key=lambda d: (d.in_flight, d.failures))
+
+    async def run(self, call, label="LLM call"):
+        """Await call(deployment) on the best deployment, trying the others in turn on retryable errors."""
+        tried = set()
+        last_error = None
+        while True:
+            deployment = self._pick(tried)
+            if deployment is None:
+                waiting = [d for d in self.deployments if d.name not in tried]
+                if not waiting:
+                    raise last_error
+                # Every remaining circuit is open. Failing now would burn the caller's retries inside the
+                # cooldown (with a single deployment, on every call), so wait for the first one to half-open.
+                delay = max(min(d.open_until for d in waiting) - time.monotonic(), 0.0)
+                logger.warning("%s waiting %.1fs for a deployment circuit to close", label, delay)
+                await asyncio.sleep(delay)
+                continue
+            tried.add(deployment.name)
+            deployment.in_flight += 1
+            try:
+                result = await call(deployment)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                deployment.record_failure()
+                last_error = e
+                logger.warning("%s failed on deployment %s: %s", label, deployment.name, str(e) or type(e).__name__)
+                continue
+            finally:
+                deployment.in_flight -= 1
+            deployment.record_success()
+            return result
+
+    def structured(self, schema):
+        return PooledStructuredLLM(self, schema)
+
+    def agent(self):
+        return PooledAgent(self)
+
+    def stats(self):
+        now = time.monotonic()
+        return [
+            {"name": d.name, "in_flight": d.in_flight, "failures": d.failures, "circuit_open": not d.available(now)}
+            for d in self.deployments
+        ]
+
+
+class PooledStructuredLLM:
+    """Drop-in for llm.with_structured_output(schema) that routes each call through the pool."""
+
+    def __init__(self, pool, schema):
+        self.pool = pool
+        self.schema = schema
+
+    async def ainvoke(self, prompt, **kwargs):
+        return await self.pool.run(
+            lambda deployment: deployment.get_structured_llm(self.schema).ainvoke(prompt, **kwargs),
+            label="Structured call"
+        )
+
+
+class PooledAgent:
+    """Drop-in for the ReAct agent; a failed run is restarted on another deployment."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def ainvoke(self, inputs, config=None, **kwargs):
+        return await self.pool.run(
+            lambda deployment: deployment.get_agent().ainvoke(inputs, config=config, **kwargs),
+            label="Agent run"
+        )
+
+
+def load_deployment_configs():
+    if not LLM_DEPLOYMENTS:
+        return [default_deployment_config()]
+    configs = json.loads(LLM_DEPLOYMENTS)
+    if isinstance(configs, dict):
+        configs = [configs]
+    for i, config in enumerate(configs):
+        config.setdefault("name", config.get("deployment") or config.get("model") or f"deployment-{i}")
+    return configs
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_llm_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            configs = load_deployment_configs()
+            _pool = LLMPool([Deployment(config["name"], config) for config in configs])
+            logger.info("LLM pool configured with %d deployment(s): %s",
+                        len(configs), ", ".join(config["name"] for config in configs))
+        return _pool
+
+
+def set_llm_pool(pool):
+    """Replace the process-wide pool (None resets it to the configured deployments on next use)."""
+    global _pool
+    with _pool_lock:
+        _pool = pool
@@ -1,36 +1,186 @@
 import os
+import fnmatch
+import logging
+import threading
+from collections import OrderedDict
 
-def list_directory(path: str) -> str:
-    entries = os.listdir(path)
-    formatted = []
-    for entry in entries:
-        entry_path = os.path.join(path, entry)
-        prefix = "[DIR]" if os.path.isdir(entry_path) else "[FILE]"
-        formatted.append(f"{prefix} {entry}")
-    return "\n".join(formatted)
-
-
-def get_folder_structure(path: str) -> dict:
-    def walk_dir(current_path):
-        structure = {"name": os.path.basename(current_path), "path": current_path}
-        if os.path.isdir(current_path):
-            structure["type"] = "directory"
+logger = logging.getLogger(__name__)
+
+# Directories the agent never needs to look inside (build output, dependencies, VCS metadata).
+TOOL_IGNORE_PATTERNS = [
+    pattern.strip() for pattern in os.getenv(
+        "TOOL_IGNORE_PATTERNS",
+        "node_modules,target,build,dist,out,.git,.svn,.hg,.idea,.vscode,.gradle,.mvn,__pycache__,.venv,venv"
+    ).split(",") if pattern.strip()
+]
+TOOL_MAX_DEPTH = int(os.getenv("TOOL_MAX_DEPTH", "4"))
+TOOL_MAX_ENTRIES = int(os.getenv("TOOL_MAX_ENTRIES", "200"))
+MAX_CACHED_INDEXES = int(os.getenv("TOOL_MAX_CACHED_INDEXES", "16"))
+
+
+def is_ignored(name, patterns=TOOL_IGNORE_PATTERNS):
+    return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+class DirectoryIndex:
+    """Snapshot of a directory tree taken with one scandir pass.
+
+    Ignored directories are listed but not descended into. With max_depth, only that many levels are scanned
+    (1 is just root itself); deeper directories are listed without their contents.
+    """
+
+    def __init__(self, root, ignore_patterns=TOOL_IGNORE_PATTERNS, max_depth=None):
+        self.root = root
+        self.max_depth = max_depth
+        # directory path -> sorted [(name, is_dir, ignored)]
+        self.entries = {}
+        self.errors = {}
+        self.file_count = 0
+        stack = [(root, 1)]
+        while stack:
+            current, depth = stack.pop()
             children = []
             try:
-                entries = sorted(os.listdir(current_path))
-                for entry in entries:
-                    entry_path = os.path.join(current_path, entry)
-                    try:
-                        children.append(walk_dir(entry_path))
-                    except Exception as e:
-                        children.append({"name": entry, "path": entry_path, "type": "error", "error": str(e)})
-            except Exception as e:
-                structure["error"] = str(e)
-                structure["children"] = []
-            else:
-                structure["children"] = children
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                        except OSError:
+                            is_dir = False
+                        ignored = is_dir and is_ignored(entry.name, ignore_patterns)
+                        children.append((entry.name, is_dir, ignored))
+                        if is_dir and not ignored and (max_depth is None or depth < max_depth):
+                            stack.append((entry.path, depth + 1))
+                        elif not is_dir:
+                            self.file_count += 1
+            except OSError as e:
+                self.errors[current] = str(e)
+                continue
+            # Directories first, then files, each alphabetically.
+            children.sort(key=lambda child: (not child[1], child[0].lower()))
+            self.entries[current] = children
+        logger.info("Indexed %s: %d directories, %d files", root, len(self.entries), self.file_count)
+
+    def contains(self, path):
+        return path in self.entries or path in self.errors
+
+    def counts(self, path):
+        """(dirs, files) directly under path, or None if path lies below the scanned depth."""
+        if path not in self.entries:
+            return None
+        children = self.entries[path]
+        dirs = sum(1 for _, is_dir, _ in children if is_dir)
+        return dirs, len(children) - dirs
+
+
+_indexes = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def _normalize(path):
+    return os.path.realpath(os.path.expanduser(path))
+
+
+def build_directory_index(path):
+    """Index the whole tree under path (a job's upload root) and keep it for the tool calls that follow."""
+    path = _normalize(path)
+    # Walk without the lock so other jobs' tool calls are not held up by a large tree.
+    index = DirectoryIndex(path)
+    if path in index.errors:
+        return index
+    with _index_lock:
+        _indexes[path] = index
+        _indexes.move_to_end(path)
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def get_directory_index(path, max_depth):
+    """Index covering path: a kept index of an ancestor if there is one, else a fresh scan max_depth levels deep.
+
+    Only build_directory_index keeps indexes, so listing an arbitrary directory never walks or caches its subtree.
+    """
+    path = _normalize(path)
+    with _index_lock:
+        for root, index in _indexes.items():
+            if index.contains(path):
+                _indexes.move_to_end(root)
+                return index
+    return DirectoryIndex(path, max_depth=max_depth)
+
+
+def clear_directory_index(path=None):
+    """Drop the index rooted at (or containing) path, or every index when path is None."""
+    with _index_lock:
+        if path is None:
+            _indexes.clear()
+            return
+        path = _normalize(path)
+        for root in [root for root, index in _indexes.items() if root == path or index.contains(path)]:
+            del _indexes[root]
+
+
+def _paginate(lines, offset, limit, hint):
+    total = len(lines)
+    page = lines[offset:offset + limit]
+    if offset + limit < total:
+        page.append(f"... {total - offset - limit} more entries; {hint} offset={offset + limit}")
+    return page
+
+
+def _describe_counts(index, path):
+    counts = index.counts(path)
+    return f" ({counts[0]} dirs, {counts[1]} files)" if counts else ""
+
+
+def list_directory(path: str, limit: int = None, offset: int = 0) -> str:
+    limit = TOOL_MAX_ENTRIES if limit is None else limit
+    # Two levels: the directory and its subdirectories, for their entry counts.
+    index = get_directory_index(path, max_depth=2)
+    path = _normalize(path)
+    if path not in index.entries:
+        return f"Error: cannot list {path}: {index.errors.get(path, 'not a directory')}"
+    lines = []
+    for name, is_dir, ignored in index.entries[path]:
+        if ignored:
+            lines.append(f"[DIR] {name}/ (ignored)")
+        elif is_dir:
+            lines.append(f"[DIR] {name}/{_describe_counts(index, os.path.join(path, name))}")
         else:
-            structure["type"] = "file"
-        return structure
-    return walk_dir(path)
+            lines.append(f"[FILE] {name}")
+    if not lines:
+        return f"{path} is empty"
+    return "\n".join(_paginate(lines, max(offset, 0), max(limit, 1), "call again with"))
+
+
+def get_folder_structure(path: str, max_depth: int = None, limit: int = None, offset: int = 0) -> str:
+    """Indented tree of path down to max_depth; deeper directories are summarized by their entry counts."""
+    max_depth = TOOL_MAX_DEPTH if max_depth is None else max_depth
+    limit = TOOL_MAX_ENTRIES if limit is None else limit
+    # One level more than is rendered, for the entry counts of the deepest directories shown.
+    index = get_directory_index(path, max_depth=min(max(max_depth, 1), TOOL_MAX_DEPTH) + 1)
+    path = _normalize(path)
+    if path not in index.entries:
+        return f"Error: cannot read {path}: {index.errors.get(path, 'not a directory')}"
+    lines = []
+
+    def render(current, depth):
+        for name, is_dir, ignored in index.entries.get(current, []):
+            indent = "  " * depth
+            if not is_dir:
+                lines.append(f"{indent}{name}")
+                continue
+            child = os.path.join(current, name)
+            if ignored:
+                lines.append(f"{indent}{name}/ (ignored)")
+            elif depth + 1 >= max_depth or child not in index.entries:
+                lines.append(f"{indent}{name}/{_describe_counts(index, child)}")
+            else:
+                lines.append(f"{indent}{name}/")
+                render(child, depth + 1)
 
+    render(path, 0)
+    complete = path == index.root and index.max_depth is None
+    header = f"{path}/ ({index.file_count} files indexed)" if complete else f"{path}/"
+    return "\n".join([header] + _paginate(lines, max(offset, 0), max(limit, 1), "call again with"))
@@ -0,0 +1,148 @@
+"""Shared setup for the benchmarks. Import this before any services module.
+
+Every benchmark runs against a scratch directory: caches, job database, manifests, uploads, downloads and
+archives never touch resources/.
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.client import HTTPConnection
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+WORK_DIR = Path(tempfile.mkdtemp(prefix="codeconversion-bench-"))
+os.environ.setdefault("MIGRATION_CACHE_PATH", str(WORK_DIR / "cache.db"))
+os.environ.setdefault("JOB_DB_PATH", str(WORK_DIR / "jobs.db"))
+os.environ.setdefault("MANIFESTS_ROOT", str(WORK_DIR / "manifests"))
+
+
+def quiet_logging(level=logging.WARNING):
+    """The services call logging.basicConfig(level=INFO) on import; per-file log lines would drown out the results.
+
+    Configuring the root logger first turns those later basicConfig calls into no-ops, so this works whether or
+    not the services are imported yet.
+    """
+    logging.basicConfig(level=level)
+    logging.getLogger().setLevel(level)
+
+
+def redirect_storage():
+    """Point upload, download and archive roots at WORK_DIR."""
+    from services import code_conversion_service, job_manifest
+    from utils import file_utils
+    downloads_root = WORK_DIR / "downloads"
+    downloads_root.mkdir(parents=True, exist_ok=True)
+    code_conversion_service.UPLOADS_ROOT = WORK_DIR / "uploads"
+    code_conversion_service.DOWNLOADS_ROOT = file_utils.DOWNLOADS_ROOT = job_manifest.DOWNLOADS_ROOT = downloads_root
+    file_utils.ARCHIVES_ROOT = WORK_DIR / "archives"
+    return downloads_root
+
+
+def fresh_cache():
+    """Swap in an empty migration cache so a run starts cold."""
+    from services import migration_cache
+    path = WORK_DIR / f"cache-{time.monotonic_ns()}.db"
+    migration_cache._migration_cache = migration_cache.MigrationCache(str(path))
+    return migration_cache._migration_cache
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # ru_maxrss is the process high-water mark (KiB on Linux, bytes on macOS).
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+
+
+class RssSampler:
+    """Peak resident set size while the block runs, sampled every interval seconds."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+
+def start_server(port):
+    """Run the FastAPI app with uvicorn in a background thread; returns the server (set should_exit to stop)."""
+    import uvicorn
+    from main import app
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def request(port, method, path, body=None, headers=None):
+    conn = HTTPConnection("127.0.0.1", port, timeout=600)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def multipart(fields, file_name, file_bytes, content_type="application/zip"):
+    import uuid
+    boundary = uuid.uuid4().hex
+    parts = []
+    for key, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n".encode() + file_bytes + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def add_fake_model_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.2, help="fixed seconds per fake model call")
+    parser.add_argument("--jitter", type=float, default=0.05, help="+/- seconds of random latency")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="output token rate (0 = instant)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of calls failing with 429")
+    parser.add_argument("--deployments", type=int, default=1, help="fake deployments in the LLM pool")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def install_fake_pool(args):
+    from agents.llm_pool import set_llm_pool
+    from benchmarks.fake_llm import make_fake_pool
+    pool, models = make_fake_pool(
+        deployments=args.deployments, latency=args.latency, jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second, failure_rate=args.failure_rate, seed=args.seed
+    )
+    set_llm_pool(pool)
+    return models
@@ -0,0 +1,121 @@
+"""Load test: /api/download latency while a large migration job runs in the same process.
+
+Starts the API on a local port with a fake chat model, measures download latency while idle, submits a
+synthetic project through /api/jobs and measures it again until the job finishes. With the event loop
+free of file I/O, p99 under load should stay close to the idle p99.
+
+    python benchmarks/download_latency.py --files 3000 --binary-kb 512
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import WORK_DIR, multipart, quiet_logging, redirect_storage, request, start_server
+from agents.llm_pool import set_llm_pool
+from benchmarks.fake_llm import make_fake_pool
+from benchmarks.synthetic_project import zip_project
+
+quiet_logging()
+
+
+def build_project(root, files, binary_kb):
+    for i in range(files):
+        package = f"pkg{i % 50}"
+        if i % 4 == 3:
+            # Incompressible non-code files exercise the copy path.
+            path = root / "assets" / package / f"blob{i}.bin"
+            data = os.urandom(binary_kb * 1024)
+        else:
+            path = root / "src" / package / f"C{i}.java"
+            data = (f"package {package};\n\npublic class C{i} {{\n" + "    int f() { return 1; }\n" * 200 + "}\n").encode()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return zip_project(root)
+
+
+def timed_download(port, path):
+    start = time.perf_counter()
+    status, _ = request(port, "GET", path)
+    if status != 200:
+        raise RuntimeError(f"Download returned {status}")
+    return time.perf_counter() - start
+
+
+def measure(port, path, clients, until):
+    """Download path from `clients` threads until until() is true; returns latencies in seconds."""
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        while not until():
+            latency = timed_download(port, path)
+            with lock:
+                latencies.append(latency)
+
+    with ThreadPoolExecutor(clients) as pool:
+        for future in [pool.submit(client) for _ in range(clients)]:
+            future.result()
+    return latencies
+
+
+def report(label, latencies):
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{label:>8}: {len(ordered):6d} requests  p50 {statistics.median(ordered) * 1000:8.2f} ms  "
+          f"p99 {p99 * 1000:8.2f} ms  max {ordered[-1] * 1000:8.2f} ms")
+    return p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--binary-kb", type=int, default=256)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake model call")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--idle-seconds", type=float, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    set_llm_pool(make_fake_pool(latency=args.llm_latency)[0])
+    downloads_root = redirect_storage()
+    probe = downloads_root / "probe" / "probe.bin"
+    probe.parent.mkdir(parents=True)
+    probe.write_bytes(os.urandom(64 * 1024))
+    probe_path = "/api/download/probe/probe.bin"
+    server = start_server(args.port)
+
+    idle_until = time.monotonic() + args.idle_seconds
+    idle_p99 = report("idle", measure(args.port, probe_path, args.clients, lambda: time.monotonic() > idle_until))
+
+    project = build_project(WORK_DIR / "project", args.files, args.binary_kb)
+    print(f"Submitting {args.files} files ({len(project) / 1e6:.1f} MB zipped)")
+    body, content_type = multipart(
+        {"code_language": "Java", "fro_version": "8", "to_version": "17"}, "project.zip", project
+    )
+    started = time.monotonic()
+    status, payload = request(args.port, "POST", "/api/jobs", body, {"Content-Type": content_type})
+    if status != 200:
+        raise SystemExit(f"Job submission failed: {status} {payload[:200]!r}")
+    job_id = json.loads(payload)["job_id"]
+
+    def wait_for_job():
+        while True:
+            _, status_payload = request(args.port, "GET", f"/api/jobs/{job_id}")
+            job_status = json.loads(status_payload)["status"]
+            if job_status in ("completed", "failed"):
+                return job_status
+            time.sleep(0.5)
+
+    with ThreadPoolExecutor(1) as poller:
+        job = poller.submit(wait_for_job)
+        busy_p99 = report("busy", measure(args.port, probe_path, args.clients, job.done))
+    print(f"Job {job.result()} in {time.monotonic() - started:.1f}s; p99 busy/idle = {busy_p99 / idle_p99:.2f}x")
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Deterministic stand-in for the chat model, for running the pipeline offline.
+
+Responses depend only on the prompt (and, for injected failures, on how often that prompt was sent), so two
+runs over the same project behave the same regardless of scheduling.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+from langchain_core.messages import AIMessage
+from agents.llm_pool import Deployment, LLMPool
+from models.migration import FileMigrationResult, MigrationBatchResult, MigrationResult
+from utils.rate_limiter import estimate_tokens
+
+
+class FakeLLMError(Exception):
+    """Injected failure; carries a status_code like the OpenAI client's errors so the pool fails over on it."""
+
+    def __init__(self, status_code):
+        super().__init__(f"Injected fake model error {status_code}")
+        self.status_code = status_code
+
+
+def fake_migrate(content):
+    return content.replace("javax.", "jakarta.").replace("new Integer(", "Integer.valueOf(")
+
+
+class FakeChatModel:
+    """Simulates latency (fixed + jitter + output tokens / tokens_per_second) and injects failures."""
+
+    def __init__(self, latency=0.2, jitter=0.0, tokens_per_second=0.0, failure_rate=0.0, failure_status=429, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.seed = seed
+        self.calls = 0
+        self.failures = 0
+        self._sent = {}
+        self._lock = threading.Lock()
+
+    def with_structured_output(self, schema, **kwargs):
+        return FakeStructuredModel(self, schema)
+
+    async def respond(self, prompt, output):
+        digest = hashlib.sha256(prompt.encode("utf-8", errors="replace")).hexdigest()
+        with self._lock:
+            self.calls += 1
+            attempt = self._sent[digest] = self._sent.get(digest, 0) + 1
+        rng = random.Random(f"{self.seed}:{digest}:{attempt}")
+        delay = max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+        if self.tokens_per_second > 0:
+            delay += estimate_tokens(output) / self.tokens_per_second
+        await asyncio.sleep(delay)
+        if rng.random() < self.failure_rate:
+            with self._lock:
+                self.failures += 1
+            raise FakeLLMError(self.failure_status)
+        return output
+
+
+class FakeStructuredModel:
+    def __init__(self, model, schema):
+        self.model = model
+        self.schema = schema
+
+    async def ainvoke(self, prompt, **kwargs):
+        request = json.loads(prompt)
+        if self.schema is MigrationBatchResult:
+            result = MigrationBatchResult(files=[
+                FileMigrationResult(path=f["path"], migrated_code=fake_migrate(f["content"]),
+                                    summary="Migrated by the fake model.")
+                for f in request["files"]
+            ])
+        else:
+            # Single-file and chunk prompts wrap the content in BEGIN/END ORIGINAL ... CONTENT markers.
+            body = request["context"].split("CONTENT ---\n", 1)[-1].rsplit("\n--- END ORIGINAL", 1)[0]
+            result = MigrationResult(migrated_code=fake_migrate(body), summary="Migrated by the fake model.")
+        await self.model.respond(prompt, result.model_dump_json())
+        return result
+
+
+class FakeAgent:
+    """Answers the Step 1-3 analysis prompts with a fixed text after the model's simulated latency."""
+
+    def __init__(self, model):
+        self.model = model
+
+    async def ainvoke(self, inputs, config=None, **kwargs):
+        prompt = str(inputs["messages"][-1].content)
+        answer = await self.model.respond(prompt, "Fake analysis: no structural issues found. " * 20)
+        return {"messages": [AIMessage(content=answer)]}
+
+
+def make_fake_pool(deployments=1, **model_options):
+    """LLMPool of fake deployments (each with its own seed) plus the models, for reading call counts."""
+    seed = model_options.pop("seed", 0)
+    models = [FakeChatModel(seed=seed + i, **model_options) for i in range(deployments)]
+    pool = LLMPool([
+        Deployment(f"fake-{i}", chat_model=model, agent=FakeAgent(model)) for i, model in enumerate(models)
+    ])
+    return pool, models
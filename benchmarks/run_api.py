@@ -0,0 +1,128 @@
+"""End-to-end benchmark through the FastAPI endpoints against the fake model.
+
+For each size: upload a zipped synthetic project to /api/jobs, wait for the job, then download every migrated
+file (from --clients threads) and the project zip.
+
+    python benchmarks/run_api.py --sizes 10,100,1000 --json api.json
+    python benchmarks/run_api.py --sizes 10,100,1000 --baseline api.json
+"""
+import argparse
+import json
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import (
+    WORK_DIR, RssSampler, add_fake_model_arguments, fresh_cache, install_fake_pool, multipart, percentile,
+    quiet_logging, redirect_storage, request, start_server
+)
+from benchmarks.synthetic_project import generate_project, zip_project
+
+quiet_logging()
+
+
+def timed(port, method, path, body=None, headers=None):
+    start = time.perf_counter()
+    status, payload = request(port, method, path, body, headers)
+    if status != 200:
+        raise RuntimeError(f"{method} {path} returned {status}: {payload[:200]!r}")
+    return time.perf_counter() - start, payload
+
+
+def wait_for_job(port, job_id):
+    while True:
+        _, payload = request(port, "GET", f"/api/jobs/{job_id}")
+        status = json.loads(payload)["status"]
+        if status in ("completed", "failed"):
+            return status
+        time.sleep(0.1)
+
+
+def run_size(port, files, args):
+    project_dir = WORK_DIR / f"api-project-{files}"
+    generate_project(project_dir, files, seed=args.seed)
+    project = zip_project(project_dir)
+    shutil.rmtree(project_dir, ignore_errors=True)
+    fresh_cache()
+    models = install_fake_pool(args)
+    body, content_type = multipart({"code_language": "Java", "fro_version": "8", "to_version": "17"}, "project.zip", project)
+
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        upload_seconds, payload = timed(port, "POST", "/api/jobs", body, {"Content-Type": content_type})
+        job_id = json.loads(payload)["job_id"]
+        status = wait_for_job(port, job_id)
+        job_seconds = time.perf_counter() - started
+        if status != "completed":
+            raise RuntimeError(f"Job {job_id} {status}")
+        _, payload = timed(port, "GET", f"/api/jobs/{job_id}/result")
+        result = json.loads(payload)
+
+        latencies = []
+        downloaded = [0]
+        lock = threading.Lock()
+
+        def download(link):
+            seconds, data = timed(port, "GET", link)
+            with lock:
+                latencies.append(seconds)
+                downloaded[0] += len(data)
+
+        download_started = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            list(pool.map(download, result["download_links"]))
+        download_seconds = time.perf_counter() - download_started
+        zip_seconds, zip_data = timed(port, "GET", result["project_zip_link"])
+
+    return {
+        "files": files,
+        "zip_mb": round(len(project) / 1e6, 2),
+        "upload_s": round(upload_seconds, 3),
+        "job_s": round(job_seconds, 3),
+        "files_per_sec": round(files / job_seconds, 2),
+        "model_calls": sum(model.calls for model in models),
+        "download_p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "download_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "download_mb_per_sec": round(downloaded[0] / 1e6 / download_seconds, 2) if download_seconds else 0.0,
+        "project_zip_s": round(zip_seconds, 3),
+        "project_zip_mb": round(len(zip_data) / 1e6, 2),
+        "peak_rss_mb": round(rss.peak / 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000", help="comma-separated project sizes in files")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent download clients")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results written earlier with --json")
+    add_fake_model_arguments(parser)
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {row["files"]: row for row in json.load(f)}
+    redirect_storage()
+    server = start_server(args.port)
+    rows = []
+    try:
+        for files in [int(size) for size in args.sizes.split(",")]:
+            row = run_size(args.port, files, args)
+            rows.append(row)
+            text = "  ".join(f"{key}={value}" for key, value in row.items())
+            before = baseline.get(files)
+            if before and before["files_per_sec"]:
+                text += f"  (files/sec {row['files_per_sec'] / before['files_per_sec']:.2f}x baseline)"
+            print(text, flush=True)
+    finally:
+        server.should_exit = True
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
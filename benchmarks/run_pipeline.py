@@ -0,0 +1,106 @@
+"""Throughput of run_migration_agent against the fake model, for projects of several sizes.
+
+    python benchmarks/run_pipeline.py --sizes 10,100,1000 --latency 0.2 --json results.json
+    python benchmarks/run_pipeline.py --sizes 10,100,1000 --baseline results.json
+
+Each size runs cold (empty cache) and, with --warm, a second time against the warm cache. --baseline prints
+the change against a previous --json file, so concurrency, caching or batching changes can be compared.
+"""
+import argparse
+import asyncio
+import json
+import shutil
+import time
+
+from common import (
+    WORK_DIR, RssSampler, add_fake_model_arguments, fresh_cache, install_fake_pool, percentile, quiet_logging,
+    redirect_storage
+)
+from benchmarks.synthetic_project import generate_project
+from services import migration_agent
+from utils.metrics import Trace, use_trace
+
+quiet_logging()
+
+
+async def run_once(uploads_dir, downloads_dir):
+    trace = Trace()
+    with RssSampler() as rss, use_trace(trace):
+        start = time.perf_counter()
+        _, _, summaries = await migration_agent.run_migration_agent(uploads_dir, downloads_dir, "Java", "8", "17")
+        seconds = time.perf_counter() - start
+    return seconds, summaries, trace.to_dict(), rss.peak
+
+
+def summarize(label, files, seconds, trace, peak_rss, cache_before, cache_after, models):
+    llm_spans = [s for s in trace["spans"] if s["name"] == "llm_call"]
+    llm_totals = trace["totals"].get("llm_call", {})
+    hits = cache_after["hits"] - cache_before["hits"]
+    lookups = hits + cache_after["misses"] - cache_before["misses"]
+    return {
+        "run": label,
+        "files": files,
+        "seconds": round(seconds, 3),
+        "files_per_sec": round(files / seconds, 2) if seconds else 0.0,
+        "llm_requests": len(llm_spans) + trace["dropped_spans"],
+        "model_calls": sum(model.calls for model in models),
+        "injected_failures": sum(model.failures for model in models),
+        "prompt_tokens": int(llm_totals.get("prompt_tokens", 0)),
+        "llm_p50_s": round(percentile([s["seconds"] for s in llm_spans], 0.5), 4),
+        "llm_p99_s": round(percentile([s["seconds"] for s in llm_spans], 0.99), 4),
+        "queue_wait_p99_s": round(percentile([s["queue_wait"] for s in llm_spans], 0.99), 4),
+        "cache_hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+        "peak_rss_mb": round(peak_rss / 1e6, 1),
+    }
+
+
+def print_row(row, baseline=None):
+    columns = ["run", "files", "seconds", "files_per_sec", "llm_requests", "model_calls", "llm_p50_s", "llm_p99_s",
+               "queue_wait_p99_s", "cache_hit_ratio", "peak_rss_mb"]
+    text = "  ".join(f"{key}={row[key]}" for key in columns)
+    if baseline:
+        before = baseline.get((row["run"], row["files"]))
+        if before and before["files_per_sec"]:
+            text += f"  (files/sec {row['files_per_sec'] / before['files_per_sec']:.2f}x baseline)"
+    print(text, flush=True)
+
+
+async def main(args):
+    redirect_storage()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {(row["run"], row["files"]): row for row in json.load(f)}
+    rows = []
+    for files in [int(size) for size in args.sizes.split(",")]:
+        uploads_dir = WORK_DIR / f"project-{files}"
+        generate_project(uploads_dir, files, seed=args.seed)
+        cache = fresh_cache()
+        runs = ["cold", "warm"] if args.warm else ["cold"]
+        for label in runs:
+            models = install_fake_pool(args)
+            downloads_dir = WORK_DIR / f"out-{files}-{label}"
+            cache_before = cache.stats()
+            seconds, summaries, trace, peak_rss = await run_once(str(uploads_dir), str(downloads_dir))
+            row = summarize(label, len(summaries), seconds, trace, peak_rss, cache_before, cache.stats(), models)
+            rows.append(row)
+            print_row(row, baseline)
+            shutil.rmtree(downloads_dir, ignore_errors=True)
+        shutil.rmtree(uploads_dir, ignore_errors=True)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000", help="comma-separated project sizes in files")
+    parser.add_argument("--warm", action="store_true", help="also run each size against the warm cache")
+    parser.add_argument("--concurrency", type=int, default=None, help="override MIGRATION_CONCURRENCY")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results written earlier with --json")
+    add_fake_model_arguments(parser)
+    args = parser.parse_args()
+    if args.concurrency:
+        migration_agent.MIGRATION_CONCURRENCY = args.concurrency
+    asyncio.run(main(args))
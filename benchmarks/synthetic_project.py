@@ -0,0 +1,81 @@
+"""Synthetic Java projects of a given size with a realistic mix of file types and sizes."""
+import io
+import os
+import random
+import zipfile
+from pathlib import Path
+
+# (kind, weight)
+FILE_MIX = [("java", 55), ("properties", 8), ("yml", 7), ("xml", 10), ("json", 5), ("md", 5), ("binary", 10)]
+
+
+def java_source(rng, package, name):
+    roll = rng.random()
+    # Mostly small classes, some medium ones, and a few large enough to be migrated in chunks.
+    methods = rng.randint(1, 6) if roll < 0.8 else rng.randint(20, 60) if roll < 0.95 else rng.randint(200, 400)
+    legacy = rng.random() < 0.5
+    lines = [f"package {package};", ""]
+    if legacy:
+        lines += ["import javax.servlet.http.HttpServletRequest;", "import javax.annotation.PostConstruct;"]
+    lines += ["import java.util.List;", "", f"public class {name} {{", ""]
+    for i in range(methods):
+        body = "        Integer value = new Integer(%d);" % i if legacy and i % 3 == 0 else f"        int value = {i};"
+        lines += [f"    public int method{i}(List<String> items) {{", body, "        return value + items.size();",
+                  "    }", ""]
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def text_file(rng, kind, index):
+    entries = rng.randint(3, 40)
+    if kind == "properties":
+        return "".join(f"app.setting{i}=value{index}-{i}\n" for i in range(entries))
+    if kind == "yml":
+        return "app:\n" + "".join(f"  setting{i}: value{index}-{i}\n" for i in range(entries))
+    if kind == "xml":
+        deps = "".join(
+            f"    <dependency>\n      <groupId>javax.example</groupId>\n      <artifactId>lib{i}</artifactId>\n"
+            f"      <version>1.{i}</version>\n    </dependency>\n" for i in range(entries)
+        )
+        return f'<?xml version="1.0"?>\n<project>\n  <modelVersion>4.0.0</modelVersion>\n{deps}</project>\n'
+    if kind == "json":
+        return "{\n" + ",\n".join(f'  "key{i}": "value{index}-{i}"' for i in range(entries)) + "\n}\n"
+    return f"# Module {index}\n\n" + "".join(f"Notes line {i} about the module.\n" for i in range(entries))
+
+
+def generate_project(root, files, seed=0):
+    """Write `files` files under root; returns the total number of bytes written."""
+    rng = random.Random(seed)
+    kinds = [kind for kind, _ in FILE_MIX]
+    weights = [weight for _, weight in FILE_MIX]
+    modules = max(1, files // 200)
+    total = 0
+    for index in range(files):
+        kind = rng.choices(kinds, weights)[0]
+        module = f"module{index % modules}"
+        package = f"com.example.{module}.pkg{index % 17}"
+        if kind == "java":
+            path = Path(root, module, "src/main/java", *package.split("."), f"Class{index}.java")
+            data = java_source(rng, package, f"Class{index}").encode()
+        elif kind == "binary":
+            path = Path(root, module, "src/main/resources/static", f"asset{index}.png")
+            data = rng.randbytes(rng.randint(1, 256) * 1024)
+        else:
+            ext = {"properties": "properties", "yml": "yml", "xml": "xml", "json": "json", "md": "md"}[kind]
+            folder = "docs" if kind == "md" else "src/main/resources"
+            path = Path(root, module, folder, f"file{index}.{ext}")
+            data = text_file(rng, kind, index).encode()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        total += len(data)
+    return total
+
+
+def zip_project(root):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zip_ref:
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                zip_ref.write(path, os.path.relpath(path, root))
+    return buffer.getvalue()
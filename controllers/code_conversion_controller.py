@@ -1,24 +1,44 @@
 import logging
 from fastapi import UploadFile
 from services.code_conversion_service import (
-    handle_upload_and_migration, get_file_response, get_project_zip_response, process_uploaded_file
+    handle_upload_and_migration, get_file_response, get_project_zip_response, process_uploaded_file,
+    submit_migration_job, get_job_status_response, get_job_result_response, get_job_events_response
 )
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-async def upload_files_controller(file: UploadFile, code_language: str, fro_version: str, to_version: str):
+async def upload_files_controller(file: UploadFile, code_language: str, fro_version: str, to_version: str,
+                                  base_job_id: str = None):
     logger.info("Controller: upload_files_controller called for %s", file.filename)
     filename = file.filename.lower()
     if filename.endswith('.zip'):
         logger.info("File is a zip archive.")
-        return await process_uploaded_file(file, code_language, fro_version, to_version, is_zip=True)
+        return await process_uploaded_file(file, code_language, fro_version, to_version, is_zip=True,
+                                           base_job_id=base_job_id)
     else:
         logger.info("File is a single code file.")
-        return await process_uploaded_file(file, code_language, fro_version, to_version, is_zip=False)
+        return await process_uploaded_file(file, code_language, fro_version, to_version, is_zip=False,
+                                           base_job_id=base_job_id)
+
+async def submit_job_controller(file: UploadFile, code_language: str, fro_version: str, to_version: str,
+                                base_job_id: str = None):
+    logger.info("Controller: submit_job_controller called for %s", file.filename)
+    is_zip = file.filename.lower().endswith('.zip')
+    return await submit_migration_job(file, code_language, fro_version, to_version, is_zip=is_zip,
+                                      base_job_id=base_job_id)
+
+def job_status_controller(job_id):
+    return get_job_status_response(job_id)
+
+def job_result_controller(job_id):
+    return get_job_result_response(job_id)
+
+def job_events_controller(job_id, last_event_id=None):
+    return get_job_events_response(job_id, last_event_id)
 
 def download_file_controller(filename):
     return get_file_response(filename)
 
-def download_project_zip_controller(filename):
-    return get_project_zip_response(filename)
+def download_project_zip_controller(job_id, if_none_match=None, if_modified_since=None):
+    return get_project_zip_response(job_id, if_none_match, if_modified_since)
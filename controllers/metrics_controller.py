@@ -0,0 +1,7 @@
+import logging
+from services.metrics_service import get_metrics_response
+
+logger = logging.getLogger(__name__)
+
+def metrics_controller():
+    return get_metrics_response()
@@ -1,8 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes.code_conversion_route import router as code_conversion_router
+from routes.metrics_route import router as metrics_router
+from services.code_conversion_service import run_migration_job, rejected_request_response
+from services.job_manifest import BaseJobError
+from services.job_service import start_job_workers, stop_job_workers
+from utils.file_utils import UploadRejected
+from utils.async_fs import shutdown_io_executor
 
-app = FastAPI(title="Code Migration API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Workers also resume jobs left queued or orphaned by a previous process.
+    start_job_workers(run_migration_job)
+    yield
+    await stop_job_workers()
+    shutdown_io_executor()
+
+app = FastAPI(title="Code Migration API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,7 +27,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Uploads rejected by validation (bad base job, zip limits) are answered with a 4xx and the reason.
+app.add_exception_handler(BaseJobError, rejected_request_response)
+app.add_exception_handler(UploadRejected, rejected_request_response)
+
 app.include_router(code_conversion_router, prefix="/api")
+# Served at the root, where Prometheus scrapes by default.
+app.include_router(metrics_router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,8 +1,23 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class MigrationResult(BaseModel):
     migrated_code: str
     summary: str
 
+class FileMigrationResult(MigrationResult):
+    path: str
+
+class MigrationBatchResult(BaseModel):
+    files: list[FileMigrationResult]
+
 class PathInputSchema(BaseModel):
-    path: str
\ No newline at end of file
+    path: str
+
+class ListDirectoryInputSchema(PathInputSchema):
+    limit: int | None = Field(None, description="Maximum number of entries to return.")
+    offset: int = Field(0, description="Number of entries to skip, for paging through large directories.")
+
+class FolderStructureInputSchema(PathInputSchema):
+    max_depth: int | None = Field(None, description="Directories deeper than this are summarized by their entry counts.")
+    limit: int | None = Field(None, description="Maximum number of lines to return.")
+    offset: int = Field(0, description="Number of lines to skip, for paging through large trees.")
\ No newline at end of file
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, UploadFile, File, Form
+from fastapi import APIRouter, UploadFile, File, Form, Header
 from controllers.code_conversion_controller import (
-    upload_files_controller, download_file_controller, download_project_zip_controller
+    upload_files_controller, download_file_controller, download_project_zip_controller,
+    submit_job_controller, job_status_controller, job_result_controller, job_events_controller
 )
 import logging
 
@@ -14,17 +15,46 @@ async def upload_files(
     file: UploadFile = File(...),
     code_language: str = Form(...),
     fro_version: str = Form(...),
-    to_version: str = Form(...)
+    to_version: str = Form(...),
+    base_job_id: str | None = Form(None)
 ):
     logger.info("Received upload_files request: %s", file.filename)
-    return await upload_files_controller(file, code_language, fro_version, to_version)
+    return await upload_files_controller(file, code_language, fro_version, to_version, base_job_id)
+
+@router.post("/jobs")
+async def submit_job(
+    file: UploadFile = File(...),
+    code_language: str = Form(...),
+    fro_version: str = Form(...),
+    to_version: str = Form(...),
+    base_job_id: str | None = Form(None)
+):
+    logger.info("Received job submission: %s", file.filename)
+    return await submit_job_controller(file, code_language, fro_version, to_version, base_job_id)
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return job_status_controller(job_id)
+
+@router.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    return job_result_controller(job_id)
+
+@router.get("/jobs/{job_id}/events")
+def job_events(job_id: str, last_event_id: str | None = Header(default=None)):
+    logger.info("Event stream requested for job: %s", job_id)
+    return job_events_controller(job_id, last_event_id)
 
 @router.get("/download/{filename:path}")
 def download_file(filename: str):
     logger.info("Download file requested: %s", filename)
     return download_file_controller(filename)
 
-@router.get("/download_project_zip/{filename:path}")
-def download_project_zip(filename: str):
-    logger.info("Download project zip requested: %s", filename)
-    return download_project_zip_controller(filename)
+@router.get("/download_project_zip/{job_id}")
+def download_project_zip(
+    job_id: str,
+    if_none_match: str | None = Header(default=None),
+    if_modified_since: str | None = Header(default=None)
+):
+    logger.info("Download project zip requested: %s", job_id)
+    return download_project_zip_controller(job_id, if_none_match, if_modified_since)
@@ -0,0 +1,8 @@
+from fastapi import APIRouter
+from controllers.metrics_controller import metrics_controller
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_controller()
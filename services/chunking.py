@@ -0,0 +1,218 @@
+import os
+import re
+import logging
+from utils.rate_limiter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Files whose content is larger than this (in estimated tokens) are migrated in chunks.
+MIGRATION_CHUNK_TOKEN_BUDGET = int(os.getenv("MIGRATION_CHUNK_TOKEN_BUDGET", "6000"))
+
+BRACE_EXTENSIONS = {'.java', '.js', '.ts', '.gradle', '.kts'}
+XML_EXTENSIONS = {'.xml'}
+YAML_EXTENSIONS = {'.yml', '.yaml'}
+PYTHON_EXTENSIONS = {'.py'}
+SQL_EXTENSIONS = {'.sql'}
+
+XML_TOKEN_RE = re.compile(
+    r"<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<![^>]*>|</[^>]*>|<[^>]*?/>|<[^>]*>",
+    re.DOTALL,
+)
+
+
+def _lines_with_offsets(content):
+    offset = 0
+    for line in content.splitlines(keepends=True):
+        yield offset, line
+        offset += len(line)
+
+
+def _line_starts(content):
+    return [offset for offset, _ in _lines_with_offsets(content)]
+
+
+def _brace_boundaries(content):
+    """Line starts between top-level declarations or class members (brace depth <= 1, outside parens)."""
+    boundaries = set()
+    line_starts = set(_line_starts(content))
+    depth = paren = 0
+    last_significant = None
+    state = None  # None, "line_comment", "block_comment", "string", "char", "text_block"
+    i, n = 0, len(content)
+    while i < n:
+        if i in line_starts and state in (None, "line_comment"):
+            if state == "line_comment":
+                state = None
+            if depth <= 1 and paren == 0 and last_significant in (None, "}", ";", "{"):
+                boundaries.add(i)
+        ch = content[i]
+        if state == "block_comment":
+            if content.startswith("*/", i):
+                state = None
+                i += 1
+        elif state == "text_block":
+            if content.startswith('"""', i):
+                state = None
+                i += 2
+        elif state in ("string", "char"):
+            if ch == "\\":
+                i += 1
+            elif (ch == '"' and state == "string") or (ch == "'" and state == "char") or ch == "\n":
+                state = None
+        elif state is None:
+            if content.startswith("//", i):
+                state = "line_comment"
+            elif content.startswith("/*", i):
+                state = "block_comment"
+                i += 1
+            elif content.startswith('"""', i):
+                state = "text_block"
+                i += 2
+            elif ch == '"':
+                state = "string"
+            elif ch == "'":
+                state = "char"
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth = max(0, depth - 1)
+            elif ch == "(":
+                paren += 1
+            elif ch == ")":
+                paren = max(0, paren - 1)
+            if state is None and not ch.isspace():
+                last_significant = ch
+        i += 1
+    return boundaries
+
+
+def _xml_boundaries(content):
+    """Line starts that fall between children of the root element."""
+    depth_changes = []
+    for match in XML_TOKEN_RE.finditer(content):
+        token = match.group(0)
+        if token.startswith(("<!", "<?")) or token.endswith("/>"):
+            delta = 0
+        elif token.startswith("</"):
+            delta = -1
+        else:
+            delta = 1
+        depth_changes.append((match.start(), match.end(), delta))
+    boundaries = set()
+    depth = 0
+    index = 0
+    for start in _line_starts(content):
+        while index < len(depth_changes) and depth_changes[index][1] <= start:
+            depth += depth_changes[index][2]
+            index += 1
+        inside_token = index < len(depth_changes) and depth_changes[index][0] < start
+        if depth <= 1 and not inside_token:
+            boundaries.add(start)
+    return boundaries
+
+
+def _yaml_boundaries(content):
+    boundaries = set()
+    for start, line in _lines_with_offsets(content):
+        if line.startswith("---") or (line[:1] and not line[:1].isspace() and not line.startswith(("#", "- "))):
+            boundaries.add(start)
+    return boundaries
+
+
+def _python_boundaries(content):
+    boundaries = set()
+    for start, line in _lines_with_offsets(content):
+        ch = line[:1]
+        if ch and not ch.isspace() and ch not in "#)]}":
+            boundaries.add(start)
+    return boundaries
+
+
+def _paragraph_boundaries(content, sql=False):
+    boundaries = set()
+    previous_line = ""
+    for start, line in _lines_with_offsets(content):
+        if start == 0 or not previous_line.strip() or (sql and previous_line.rstrip().endswith(";")):
+            boundaries.add(start)
+        previous_line = line
+    return boundaries
+
+
+def find_boundaries(content, filename):
+    ext = os.path.splitext(filename.lower())[1]
+    if ext in BRACE_EXTENSIONS:
+        boundaries = _brace_boundaries(content)
+    elif ext in XML_EXTENSIONS:
+        boundaries = _xml_boundaries(content)
+    elif ext in YAML_EXTENSIONS:
+        boundaries = _yaml_boundaries(content)
+    elif ext in PYTHON_EXTENSIONS:
+        boundaries = _python_boundaries(content)
+    else:
+        boundaries = _paragraph_boundaries(content, sql=ext in SQL_EXTENSIONS)
+    boundaries.add(0)
+    return sorted(boundaries)
+
+
+def _split_oversized(segment, max_tokens):
+    # Fall back to line boundaries, then to raw characters for a single enormous line.
+    pieces = []
+    current = ""
+    for line in segment.splitlines(keepends=True):
+        if estimate_tokens(line) > max_tokens:
+            if current:
+                pieces.append(current)
+                current = ""
+            step = max_tokens * 4
+            pieces.extend(line[i:i + step] for i in range(0, len(line), step))
+        elif current and estimate_tokens(current + line) > max_tokens:
+            pieces.append(current)
+            current = line
+        else:
+            current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_chunks(content, filename, max_tokens=MIGRATION_CHUNK_TOKEN_BUDGET):
+    """Split content into chunks of at most max_tokens, cutting at syntactic boundaries where possible.
+
+    The split is lossless: "".join(chunks) == content.
+    """
+    if estimate_tokens(content) <= max_tokens:
+        return [content]
+    offsets = find_boundaries(content, filename) + [len(content)]
+    segments = [content[a:b] for a, b in zip(offsets, offsets[1:]) if b > a]
+    chunks = []
+    current = ""
+    for segment in segments:
+        if estimate_tokens(segment) > max_tokens:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(_split_oversized(segment, max_tokens))
+        elif current and estimate_tokens(current + segment) > max_tokens:
+            chunks.append(current)
+            current = segment
+        else:
+            current += segment
+    if current:
+        chunks.append(current)
+    logger.info("Split %s into %d chunks", filename, len(chunks))
+    return chunks
+
+
+def file_header(content, max_lines=40):
+    """Leading lines of a file (package, imports, declarations) given to every chunk as read-only context."""
+    return "".join(content.splitlines(keepends=True)[:max_lines])
+
+
+def stitch_chunks(original_chunks, migrated_chunks):
+    # Keep the line break between chunks even if the model trimmed trailing newlines.
+    parts = []
+    for original, migrated in zip(original_chunks, migrated_chunks):
+        if original.endswith("\n") and not migrated.endswith("\n"):
+            migrated += "\n"
+        parts.append(migrated)
+    return "".join(parts)
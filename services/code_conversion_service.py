@@ -1,13 +1,20 @@
 import logging
-from services.migration_agent import run_migration_agent
-from utils.file_utils import save_uploads, prepare_download_links, zip_downloads, get_file_from_downloads
+from services.migration_agent import run_migration_agent, is_agent_error
+from agents.tools import clear_directory_index
+from services.job_service import enqueue_job, get_job, get_job_store, stream_job_events, JOB_COMPLETED
+from services.job_manifest import load_base_job, write_manifest
+from utils.file_utils import (
+    save_uploads, prepare_download_links, zip_downloads, get_file_from_downloads, spool_upload, safe_extract_zip,
+    get_project_archive, DOWNLOADS_ROOT
+)
+from utils.async_fs import run_io
+from utils.metrics import REGISTRY, Trace, span, use_trace
 from models.migration import MigrationResult
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
 from fastapi.responses import StreamingResponse
+from email.utils import formatdate, parsedate_to_datetime
 import shutil
 from pathlib import Path
-import zipfile
-import io
 from fastapi import UploadFile
 import os
 import uuid
@@ -16,18 +23,27 @@ import uuid
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+UPLOADS_ROOT = Path(__file__).parent.parent / "resources/uploads"
+
+MIGRATION_JOBS = REGISTRY.counter("migration_jobs_total", "Migration jobs run, by outcome.", ["status"])
+
 async def handle_upload_and_migration(files, code_language, fro_version, to_version):
     logger.info("Starting upload and migration for %d file(s)", len(files))
-    uploads_dir, downloads_dir = save_uploads(files)
-    migration_summary, download_links = await run_migration_agent(
-        uploads_dir, downloads_dir, code_language, fro_version, to_version
-    )
-    zip_downloads(downloads_dir, str(files[0].filename))
+    uploads_dir, downloads_dir = await run_io(save_uploads, files)
+    try:
+        migration_summary, download_links, _ = await run_migration_agent(
+            uploads_dir, downloads_dir, code_language, fro_version, to_version
+        )
+    finally:
+        # The shared upload directory changes with every request; never answer from a stale index.
+        clear_directory_index(uploads_dir)
+        clear_directory_index(downloads_dir)
+    await run_io(zip_downloads, downloads_dir, str(files[0].filename))
     logger.info("Migration and zipping complete for %s", files[0].filename)
     return {
         "summary": migration_summary,
         "download_links": download_links,
-        "project_zip_link": "/api/download_project_zip"
+        "project_zip_link": f"/api/download_project_zip/{Path(downloads_dir).name}"
     }
 
 def get_file_response(filename):
@@ -38,42 +54,223 @@ def get_file_response(filename):
         return JSONResponse(status_code=404, content={"error": "File not found"})
     return file_response
 
-def get_project_zip_response(filename):
-    downloads_dir = Path(__file__).parent.parent / "resources/downloads"
-    zip_path = downloads_dir / f"{filename}.zip"
-    if zip_path.exists():
-        zip_path.unlink()
-    shutil.make_archive(str(zip_path.with_suffix('')), 'zip', str(downloads_dir))
-    logger.info("Project zip created: %s", zip_path)
-    zip_file = open(zip_path, "rb")
-    return StreamingResponse(zip_file, media_type="application/zip", headers={"Content-Disposition": f"attachment; filename={filename}.zip"})
-
-async def process_uploaded_file(file: UploadFile, code_language: str, fro_version: str, to_version: str, is_zip: bool):
-    job_id = str(uuid.uuid4())
-    uploads_dir = Path(__file__).parent.parent / "resources/uploads" / job_id
-    downloads_dir = Path(__file__).parent.parent / "resources/downloads" / job_id
-    uploads_dir.mkdir(parents=True, exist_ok=True)
-    downloads_dir.mkdir(parents=True, exist_ok=True)
+def get_project_zip_response(job_id, if_none_match=None, if_modified_since=None):
+    zip_path = get_project_archive(job_id)
+    if not zip_path:
+        logger.warning("Project zip not found for job: %s", job_id)
+        return JSONResponse(status_code=404, content={"error": "Project zip not found"})
+    stat = zip_path.stat()
+    # The archive is written once per job and replaced atomically, so mtime and size identify its content.
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=0, must-revalidate"}
+    not_modified = False
+    if if_none_match:
+        not_modified = etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    elif if_modified_since:
+        try:
+            not_modified = int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            not_modified = False
+    if not_modified:
+        return Response(status_code=304, headers={**headers, "Last-Modified": formatdate(stat.st_mtime, usegmt=True)})
+    logger.info("Serving project zip: %s", zip_path)
+    # FileResponse streams from disk, closes the file, and answers Range/If-Range requests.
+    return FileResponse(str(zip_path), media_type="application/zip", filename=zip_path.name, headers=headers)
+
+async def ingest_upload(file: UploadFile, job_id: str, is_zip: bool):
+    uploads_dir = UPLOADS_ROOT / job_id
+    await run_io(uploads_dir.mkdir, parents=True, exist_ok=True)
     logger.info("Processing upload: %s (zip: %s)", file.filename, is_zip)
 
-    if is_zip:
-        contents = await file.read()
-        with zipfile.ZipFile(io.BytesIO(contents)) as zip_ref:
-            zip_ref.extractall(uploads_dir)
-        logger.info("Extracted zip file to %s", uploads_dir)
-    else:
-        file_path = uploads_dir / file.filename
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        logger.info("Saved file to %s", file_path)
-
-    migration_summary, download_links = await run_migration_agent(
-        str(uploads_dir), str(downloads_dir), code_language, fro_version, to_version
-    )
-    zip_downloads(str(downloads_dir), str(file.filename))
-    logger.info("Migration and zipping complete for %s", file.filename)
+    try:
+        if is_zip:
+            # Spool next to the job directory (same filesystem) and extract from disk, never from memory.
+            spool_path = UPLOADS_ROOT / f"{job_id}.zip.part"
+            try:
+                with span("upload") as attrs:
+                    attrs["bytes"] = await spool_upload(file, spool_path)
+                with span("extract") as attrs:
+                    attrs["bytes"] = await run_io(safe_extract_zip, spool_path, uploads_dir)
+            finally:
+                await run_io(spool_path.unlink, missing_ok=True)
+            logger.info("Extracted zip file to %s", uploads_dir)
+        else:
+            file_path = uploads_dir / Path(file.filename).name
+            with span("upload") as attrs:
+                attrs["bytes"] = await spool_upload(file, file_path)
+            logger.info("Saved file to %s", file_path)
+    except Exception:
+        await run_io(shutil.rmtree, uploads_dir, ignore_errors=True)
+        raise
+    return uploads_dir
+
+async def migrate_job(job_id, filename, code_language, fro_version, to_version, on_event=None, base_job_id=None,
+                      spans=None):
+    """Run a job and return its result; spans are ones already recorded for it (e.g. the upload)."""
+    trace = Trace(spans)
+    with use_trace(trace):
+        try:
+            result = await _migrate_job(job_id, filename, code_language, fro_version, to_version, on_event, base_job_id)
+        except Exception:
+            MIGRATION_JOBS.inc(status="failed")
+            raise
+    MIGRATION_JOBS.inc(status="completed")
+    result["timings"] = trace.to_dict()
+    return result
+
+async def _migrate_job(job_id, filename, code_language, fro_version, to_version, on_event, base_job_id):
+    uploads_dir = UPLOADS_ROOT / job_id
+    downloads_dir = DOWNLOADS_ROOT / job_id
+    await run_io(downloads_dir.mkdir, parents=True, exist_ok=True)
+    base = await run_io(load_base_job, base_job_id, code_language, fro_version, to_version) if base_job_id else None
+    try:
+        migration_summary, download_links, migration_summaries = await run_migration_agent(
+            str(uploads_dir), str(downloads_dir), code_language, fro_version, to_version, on_event=on_event, base=base
+        )
+    finally:
+        # The agent's directory tools index the job's trees once; release them with the job.
+        clear_directory_index(str(uploads_dir))
+        clear_directory_index(str(downloads_dir))
+    with span("manifest"):
+        # An agent error is not a review later jobs should build on.
+        manifest_summary = None if is_agent_error(migration_summary) else migration_summary
+        await run_io(write_manifest, job_id, code_language, fro_version, to_version, manifest_summary, migration_summaries)
+    with span("zip"):
+        await run_io(zip_downloads, str(downloads_dir), str(filename), job_id)
+    logger.info("Migration and zipping complete for %s", filename)
     return {
+        "job_id": job_id,
         "summary": migration_summary,
-        "download_links": download_links,
-        "project_zip_link": f"/api/download_project_zip?filename={file.filename}"
+        # Links from the agent are relative to the job directory; downloads are served from the downloads root.
+        "download_links": [link.replace("/api/download/", f"/api/download/{job_id}/", 1) for link in download_links],
+        "project_zip_link": f"/api/download_project_zip/{job_id}"
+    }
+
+def rejected_request_response(request, exc):
+    """Exception handler for BaseJobError and UploadRejected raised while accepting an upload."""
+    logger.warning("Rejected %s: %s", request.url.path, str(exc))
+    return JSONResponse(status_code=getattr(exc, "status_code", 400), content={"error": str(exc)})
+
+async def accept_upload(file: UploadFile, code_language: str, fro_version: str, to_version: str, is_zip: bool,
+                        base_job_id: str = None):
+    """Check the base job and ingest the upload under a new job id; returns (job_id, trace).
+
+    Raises BaseJobError or UploadRejected, which the app answers with rejected_request_response.
+    """
+    job_id = str(uuid.uuid4())
+    trace = Trace()
+    if base_job_id:
+        await run_io(load_base_job, base_job_id, code_language, fro_version, to_version)
+    with use_trace(trace):
+        await ingest_upload(file, job_id, is_zip)
+    return job_id, trace
+
+async def process_uploaded_file(file: UploadFile, code_language: str, fro_version: str, to_version: str, is_zip: bool,
+                                base_job_id: str = None):
+    job_id, trace = await accept_upload(file, code_language, fro_version, to_version, is_zip, base_job_id)
+    return await migrate_job(job_id, file.filename, code_language, fro_version, to_version, base_job_id=base_job_id,
+                             spans=trace.spans)
+
+async def submit_migration_job(file: UploadFile, code_language: str, fro_version: str, to_version: str, is_zip: bool,
+                               base_job_id: str = None):
+    job_id, trace = await accept_upload(file, code_language, fro_version, to_version, is_zip, base_job_id)
+    await enqueue_job(job_id, {
+        "filename": file.filename,
+        "code_language": code_language,
+        "fro_version": fro_version,
+        "to_version": to_version,
+        "base_job_id": base_job_id,
+        # Upload timings travel with the job so they end up in its result.
+        "spans": trace.spans,
+    })
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}",
+        "result_url": f"/api/jobs/{job_id}/result",
+        "events_url": f"/api/jobs/{job_id}/events"
+    }
+
+async def run_migration_job(job):
+    job_id = job["job_id"]
+    params = job["params"]
+    store = get_job_store()
+    completed = 0
+
+    async def on_event(event):
+        nonlocal completed
+        progress = None
+        if event["type"] == "file":
+            # The code itself is read back from the job's output when the event is sent (see hydrate_job_event),
+            # so the event store does not hold a second copy of every migrated project.
+            stored = {key: value for key, value in event.items() if key != "migrated_code"}
+            stored["has_migrated_code"] = event["migrated_code"] is not None
+            stored["download_link"] = f"/api/download/{job_id}/{event['path']}"
+            event = stored
+            completed += 1
+            progress = {"completed_files": completed}
+        elif event["type"] == "step":
+            progress = {"stage": f"step{event['step']}_{event['status']}"}
+        elif event["type"] == "files_discovered":
+            progress = {"stage": "migrating_files", "total_files": event["total_files"]}
+        # One transaction per event, off the event loop: SQLite may wait on another process's write lock.
+        await run_io(store.append_event, job_id, event, progress)
+
+    return await migrate_job(
+        job_id, params["filename"], params["code_language"], params["fro_version"], params["to_version"],
+        on_event=on_event, base_job_id=params.get("base_job_id"), spans=params.get("spans")
+    )
+
+def get_job_status_response(job_id):
+    job = get_job(job_id)
+    if not job:
+        logger.warning("Job not found: %s", job_id)
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": {
+            "total_files": job["total_files"],
+            "completed_files": job["completed_files"]
+        },
+        "attempts": job["attempts"],
+        "error": job["error"],
+        "result_url": f"/api/jobs/{job_id}/result" if job["status"] == JOB_COMPLETED else None
     }
+
+def hydrate_job_event(job_id, event):
+    """Put a file event's migrated code back in, read from the job's output."""
+    if event["type"] == "file" and "has_migrated_code" in event:
+        has_code = event.pop("has_migrated_code")
+        event["migrated_code"] = None
+        if has_code:
+            path = DOWNLOADS_ROOT / job_id / event["path"]
+            try:
+                event["migrated_code"] = path.read_text(encoding="utf-8", errors="replace")
+            except OSError as e:
+                logger.warning("Migrated file %s unavailable for event replay: %s", path, str(e))
+    return event
+
+def get_job_events_response(job_id, last_event_id=None):
+    if not get_job(job_id):
+        logger.warning("Job not found: %s", job_id)
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    try:
+        after_seq = int(last_event_id) if last_event_id else 0
+    except ValueError:
+        after_seq = 0
+    return StreamingResponse(
+        stream_job_events(job_id, after_seq, hydrate=lambda event: hydrate_job_event(job_id, event)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def get_job_result_response(job_id):
+    job = get_job(job_id)
+    if not job:
+        logger.warning("Job not found: %s", job_id)
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    if job["status"] != JOB_COMPLETED:
+        return JSONResponse(status_code=409, content={"error": f"Job is {job['status']}", "status": job["status"]})
+    return job["result"]
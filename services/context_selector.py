@@ -0,0 +1,182 @@
+import math
+import os
+import re
+import logging
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_SELECTION_ENABLED = os.getenv("CONTEXT_SELECTION_ENABLED", "true").lower() == "true"
+CONTEXT_TOP_K = int(os.getenv("CONTEXT_TOP_K", "6"))
+CONTEXT_STRUCTURE_TOP_K = int(os.getenv("CONTEXT_STRUCTURE_TOP_K", "3"))
+CONTEXT_PASSAGE_CHARS = int(os.getenv("CONTEXT_PASSAGE_CHARS", "800"))
+CONTEXT_QUERY_TERMS = int(os.getenv("CONTEXT_QUERY_TERMS", "200"))
+DOCUMENT_EXTENSIONS = {'.txt', '.md'}
+
+IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*")
+CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+IMPORT_RE = re.compile(r"^\s*(?:import|package)\s+(?:static\s+)?([\w.*]+)", re.MULTILINE)
+ANNOTATION_RE = re.compile(r"@([A-Za-z_][\w.]*)")
+
+STOPWORDS = {
+    "the", "a", "an", "and", "or", "of", "to", "in", "on", "for", "is", "are", "be", "it", "this", "that", "with",
+    "as", "by", "at", "from", "if", "else", "return", "new", "public", "private", "protected", "static", "final",
+    "void", "class", "int", "string", "true", "false", "null", "var", "let", "const", "def", "self",
+}
+
+
+def tokenize(text):
+    tokens = []
+    for match in IDENTIFIER_RE.finditer(text):
+        word = match.group(0)
+        parts = word.split(".")
+        if len(parts) > 1:
+            tokens.append(word.lower())
+        for part in parts:
+            lowered = part.lower()
+            if len(lowered) > 1 and lowered not in STOPWORDS:
+                tokens.append(lowered)
+            camel = [p.lower() for p in CAMEL_RE.findall(part)]
+            if len(camel) > 1:
+                tokens.extend(p for p in camel if len(p) > 2 and p not in STOPWORDS)
+    return tokens
+
+
+def split_passages(text, source, max_chars=CONTEXT_PASSAGE_CHARS):
+    """Split text into passages of roughly max_chars at paragraph, then line, boundaries."""
+    passages = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        current = []
+        size = 0
+        for line in paragraph.splitlines():
+            if current and size + len(line) > max_chars:
+                passages.append((source, "\n".join(current).strip()))
+                # Carry the last line over so a sentence split across lines stays findable.
+                current = current[-1:]
+                size = len(current[0])
+            current.append(line)
+            size += len(line) + 1
+        if current:
+            passages.append((source, "\n".join(current).strip()))
+    return [(src, passage) for src, passage in passages if passage]
+
+
+class BM25Index:
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for index, (_, text) in enumerate(passages):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((index, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def search(self, query_terms, k):
+        if not self.passages or k <= 0:
+            return []
+        n = len(self.passages)
+        scores = defaultdict(float)
+        for term in set(query_terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, tf in postings:
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1))
+                scores[index] += idf * tf * (self.k1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        # Present passages in their original order so related ones read naturally.
+        return [self.passages[index] for index, _ in sorted(ranked)]
+
+
+def extract_query_terms(file_content, limit=CONTEXT_QUERY_TERMS):
+    """Query terms for a file: imports and annotations first, then its other identifiers."""
+    priority = []
+    for name in IMPORT_RE.findall(file_content) + ANNOTATION_RE.findall(file_content):
+        priority.extend(tokenize(name))
+    terms = list(dict.fromkeys(priority + tokenize(file_content)))
+    return terms[:limit]
+
+
+_document_indexes = {}
+_document_lock = threading.Lock()
+
+
+def load_document_passages(documents_dir):
+    passages = []
+    for root, dirs, files in os.walk(documents_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if os.path.splitext(file.lower())[1] not in DOCUMENT_EXTENSIONS:
+                continue
+            path = Path(root) / file
+            try:
+                text = path.read_text(encoding="utf-8", errors="replace")
+            except OSError as e:
+                logger.error("Could not read document %s: %s", path, str(e))
+                continue
+            passages.extend(split_passages(text, f"Documentation ({file})"))
+    return passages
+
+
+def get_document_passages(documents_dir, fingerprint):
+    # Passages only change when the documents do, so they are kept per directory fingerprint.
+    with _document_lock:
+        key = (str(documents_dir), fingerprint)
+        if key not in _document_indexes:
+            _document_indexes.clear()
+            _document_indexes[key] = load_document_passages(documents_dir)
+            logger.info("Indexed %d documentation passages from %s", len(_document_indexes[key]), documents_dir)
+        return _document_indexes[key]
+
+
+class ContextSelector:
+    """Selects the Step 1/Step 2 and documentation passages relevant to one file."""
+
+    def __init__(self, step1_results, step2_results, document_passages=(),
+                 top_k=CONTEXT_TOP_K, structure_top_k=CONTEXT_STRUCTURE_TOP_K):
+        self.step1_results = step1_results
+        self.step2_results = step2_results
+        self.top_k = top_k
+        self.structure_top_k = structure_top_k
+        self.structure_index = BM25Index(split_passages(step1_results, "Project structure"))
+        self.migration_index = BM25Index(split_passages(step2_results, "Migration notes") + list(document_passages))
+
+    @staticmethod
+    def _render(passages):
+        return "\n\n".join(f"[{source}]\n{text}" for source, text in passages)
+
+    def select(self, file_content):
+        terms = extract_query_terms(file_content)
+        structure = self.structure_index.search(terms, self.structure_top_k)
+        migration = self.migration_index.search(terms, self.top_k)
+        # Fall back to the full text when nothing matches, so the prompt never loses its context entirely.
+        step1_context = self._render(structure) if structure else self.step1_results
+        step2_context = self._render(migration) if migration else self.step2_results
+        return step1_context, step2_context
+
+
+class FullContext:
+    """Selector used when context selection is disabled: every file gets the complete results."""
+
+    def __init__(self, step1_results, step2_results):
+        self.step1_results = step1_results
+        self.step2_results = step2_results
+
+    def select(self, file_content):
+        return self.step1_results, self.step2_results
+
+
+def build_context_selector(step1_results, step2_results, documents_dir=None, documents_fingerprint=None):
+    if not CONTEXT_SELECTION_ENABLED:
+        return FullContext(step1_results, step2_results)
+    document_passages = []
+    if documents_dir is not None and documents_fingerprint is not None:
+        document_passages = get_document_passages(documents_dir, documents_fingerprint)
+    return ContextSelector(step1_results, step2_results, document_passages)
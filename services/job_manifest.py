@@ -0,0 +1,57 @@
+import json
+import logging
+import os
+from pathlib import Path
+from utils.file_utils import DOWNLOADS_ROOT
+
+logger = logging.getLogger(__name__)
+
+MANIFESTS_ROOT = Path(os.getenv("MANIFESTS_ROOT", str(Path(__file__).parent.parent / "resources/manifests")))
+
+
+class BaseJobError(ValueError):
+    pass
+
+
+def manifest_path(job_id):
+    return MANIFESTS_ROOT / f"{job_id}.json"
+
+
+def write_manifest(job_id, code_language, fro_version, to_version, summary, migration_summaries):
+    """Record what a finished job produced so later uploads can be migrated incrementally against it."""
+    files = {}
+    for entry in migration_summaries:
+        # Failed files are left out so a job based on this one migrates them again.
+        if "path" not in entry or "source_hash" not in entry or entry.get("failed"):
+            continue
+        files[entry["path"]] = {
+            "hash": entry["source_hash"],
+            "summary": entry["summary"],
+            "migrated": entry["migrated_code"] is not None,
+        }
+    manifest = {
+        "job_id": job_id,
+        "code_language": code_language,
+        "fro_version": fro_version,
+        "to_version": to_version,
+        "summary": summary,
+        "files": files,
+    }
+    MANIFESTS_ROOT.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path(job_id).with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp_path, manifest_path(job_id))
+    logger.info("Wrote manifest for job %s (%d files)", job_id, len(files))
+
+
+def load_base_job(base_job_id, code_language, fro_version, to_version):
+    """Manifest of a previous job plus its output directory, validated against the new job's parameters."""
+    path = manifest_path(base_job_id)
+    # Job ids are uuids; anything with path separators cannot name a manifest.
+    if os.path.basename(base_job_id) != base_job_id or not path.is_file():
+        raise BaseJobError(f"Unknown or unfinished base job: {base_job_id}")
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    if (manifest["code_language"], manifest["fro_version"], manifest["to_version"]) != (code_language, fro_version, to_version):
+        raise BaseJobError("Base job was migrated with a different language or version pair")
+    manifest["downloads_dir"] = str(DOWNLOADS_ROOT / base_job_id)
+    return manifest
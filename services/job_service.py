@@ -0,0 +1,402 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from utils.async_fs import run_io
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", str(Path(__file__).parent.parent / "resources/jobs/jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+# A running job whose heartbeat is older than this is considered orphaned and is picked up again.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Event streams poll the store at this interval to see events written by other processes.
+JOB_EVENT_POLL_INTERVAL = float(os.getenv("JOB_EVENT_POLL_INTERVAL", "1"))
+JOB_EVENT_KEEPALIVE = float(os.getenv("JOB_EVENT_KEEPALIVE", "15"))
+# Events of jobs finished longer ago than this are deleted (0 keeps them forever).
+JOB_EVENT_RETENTION_SECONDS = float(os.getenv("JOB_EVENT_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+class JobStore:
+    """SQLite-backed job queue shared by every API process on the host."""
+
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode; claim_next opens its own IMMEDIATE transaction.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " params TEXT NOT NULL,"
+            " stage TEXT,"
+            " total_files INTEGER NOT NULL DEFAULT 0,"
+            " completed_files INTEGER NOT NULL DEFAULT 0,"
+            " result TEXT,"
+            " error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker_id TEXT,"
+            " heartbeat_at REAL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " job_id TEXT NOT NULL,"
+            " event TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id, seq)")
+        self._listeners = {}
+
+    def create(self, job_id, params):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, status, params, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, json.dumps(params), now, now),
+            )
+        self.append_event(job_id, {"type": "job", "status": JOB_QUEUED})
+        logger.info("Queued job %s", job_id)
+
+    def claim_next(self, worker_id):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT job_id, attempts FROM jobs"
+                    " WHERE status = ? OR (status = ? AND heartbeat_at < ?)"
+                    " ORDER BY created_at LIMIT 1",
+                    (JOB_QUEUED, JOB_RUNNING, now - JOB_LEASE_SECONDS),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                give_up_error = None
+                if row["attempts"] >= JOB_MAX_ATTEMPTS:
+                    give_up_error = f"Gave up after {row['attempts']} attempt(s)"
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                        (JOB_FAILED, give_up_error, now, row["job_id"]),
+                    )
+                    self._conn.execute("COMMIT")
+                    logger.error("Job %s exceeded %d attempts", row["job_id"], JOB_MAX_ATTEMPTS)
+                else:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, worker_id = ?, heartbeat_at = ?, attempts = attempts + 1,"
+                        " completed_files = 0, updated_at = ? WHERE job_id = ?",
+                        (JOB_RUNNING, worker_id, now, now, row["job_id"]),
+                    )
+                    self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if give_up_error:
+            self.append_event(row["job_id"], {"type": "job", "status": JOB_FAILED, "error": give_up_error})
+            return None
+        # Consumers should discard per-file events from an earlier attempt when they see this.
+        self.append_event(row["job_id"], {"type": "job", "status": JOB_RUNNING, "attempt": row["attempts"] + 1})
+        return self.get(row["job_id"])
+
+    def heartbeat(self, job_id, worker_id):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ?, updated_at = ? WHERE job_id = ? AND worker_id = ?",
+                (now, now, job_id, worker_id),
+            )
+
+    @staticmethod
+    def _progress_update(stage=None, total_files=None, completed_files=None):
+        assignments, values = ["updated_at = ?"], [time.time()]
+        if stage is not None:
+            assignments.append("stage = ?")
+            values.append(stage)
+        if total_files is not None:
+            assignments.append("total_files = ?")
+            values.append(total_files)
+        if completed_files is not None:
+            # Events for concurrently finishing files can commit out of order; never move progress backwards.
+            assignments.append("completed_files = MAX(completed_files, ?)")
+            values.append(completed_files)
+        return f"UPDATE jobs SET {', '.join(assignments)} WHERE job_id = ?", values
+
+    def update_progress(self, job_id, stage=None, total_files=None, completed_files=None):
+        sql, values = self._progress_update(stage, total_files, completed_files)
+        with self._lock:
+            self._conn.execute(sql, (*values, job_id))
+
+    # complete and fail only apply while worker_id still holds the job: a worker whose lease expired must not
+    # overwrite the attempt that reclaimed it. Both return whether the job was updated.
+    def complete(self, job_id, worker_id, result):
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, result = ?, error = NULL, updated_at = ?"
+                " WHERE job_id = ? AND worker_id = ? AND status = ?",
+                (JOB_COMPLETED, "done", json.dumps(result), time.time(), job_id, worker_id, JOB_RUNNING),
+            ).rowcount
+        if not updated:
+            logger.warning("Job %s is no longer held by %s; dropping its result", job_id, worker_id)
+            return False
+        self.append_event(job_id, {"type": "job", "status": JOB_COMPLETED, "result_url": f"/api/jobs/{job_id}/result"})
+        logger.info("Job %s completed", job_id)
+        self.prune_events()
+        return True
+
+    def fail(self, job_id, worker_id, error):
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?"
+                " WHERE job_id = ? AND worker_id = ? AND status = ?",
+                (JOB_FAILED, error, time.time(), job_id, worker_id, JOB_RUNNING),
+            ).rowcount
+        if not updated:
+            logger.warning("Job %s is no longer held by %s; dropping its failure: %s", job_id, worker_id, error)
+            return False
+        self.append_event(job_id, {"type": "job", "status": JOB_FAILED, "error": error})
+        logger.error("Job %s failed: %s", job_id, error)
+        return True
+
+    def release(self, job_id, worker_id):
+        # Hand an interrupted job back to the queue without waiting for its lease to expire. A clean shutdown is
+        # not the job's fault, so the attempt claim_next counted is given back; only crashes (expired leases) count.
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = NULL, attempts = MAX(attempts - 1, 0), updated_at = ?"
+                " WHERE job_id = ? AND worker_id = ? AND status = ?",
+                (JOB_QUEUED, time.time(), job_id, worker_id, JOB_RUNNING),
+            ).rowcount
+        if not updated:
+            return
+        self.append_event(job_id, {"type": "job", "status": JOB_QUEUED})
+        logger.info("Released job %s back to the queue", job_id)
+
+    def append_event(self, job_id, event, progress=None):
+        """Store an event; progress (update_progress keyword arguments) is applied in the same transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO job_events (job_id, event, created_at) VALUES (?, ?, ?)",
+                    (job_id, json.dumps(event), time.time()),
+                )
+                if progress:
+                    sql, values = self._progress_update(**progress)
+                    self._conn.execute(sql, (*values, job_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            listeners = list(self._listeners.get(job_id, ()))
+        for loop, wake in listeners:
+            loop.call_soon_threadsafe(wake.set)
+
+    def prune_events(self, retention=None):
+        retention = JOB_EVENT_RETENTION_SECONDS if retention is None else retention
+        if retention <= 0:
+            return 0
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM job_events WHERE job_id IN"
+                " (SELECT job_id FROM jobs WHERE status IN (?, ?) AND updated_at < ?)",
+                (JOB_COMPLETED, JOB_FAILED, time.time() - retention),
+            ).rowcount
+        if deleted:
+            logger.info("Pruned %d events of finished jobs", deleted)
+        return deleted
+
+    def get_events(self, job_id, after_seq=0):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after_seq),
+            ).fetchall()
+        return [(row["seq"], json.loads(row["event"])) for row in rows]
+
+    def add_listener(self, job_id, listener):
+        with self._lock:
+            self._listeners.setdefault(job_id, set()).add(listener)
+
+    def remove_listener(self, job_id, listener):
+        with self._lock:
+            listeners = self._listeners.get(job_id)
+            if listeners is not None:
+                listeners.discard(listener)
+                if not listeners:
+                    del self._listeners[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+class JobWorkerPool:
+    """Runs jobs on the event loop; every store call goes through the I/O pool, since SQLite may wait on locks."""
+
+    def __init__(self, store, handler, workers=JOB_WORKERS):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self._wake = asyncio.Event()
+        self._tasks = []
+        self._stopping = False
+        self._worker_prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+    def start(self):
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._run(f"{self._worker_prefix}-{i}")))
+        logger.info("Started %d job worker(s)", self.workers)
+
+    def notify(self):
+        self._wake.set()
+
+    async def stop(self):
+        # Cancellation can be swallowed by asyncio.wait_for inside a job, so workers also check this flag.
+        self._stopping = True
+        self._wake.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Job workers stopped")
+
+    async def _heartbeat(self, job_id, worker_id):
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            await run_io(self.store.heartbeat, job_id, worker_id)
+
+    async def _run(self, worker_id):
+        while not self._stopping:
+            try:
+                job = await run_io(self.store.claim_next, worker_id)
+            except Exception as e:
+                logger.error("Worker %s failed to claim a job: %s", worker_id, str(e))
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+            logger.info("Worker %s picked up job %s (attempt %d)", worker_id, job["job_id"], job["attempts"])
+            heartbeat = asyncio.create_task(self._heartbeat(job["job_id"], worker_id))
+            try:
+                result = await self.handler(job)
+                await run_io(self.store.complete, job["job_id"], worker_id, result)
+            except asyncio.CancelledError:
+                await run_io(self.store.release, job["job_id"], worker_id)
+                raise
+            except Exception as e:
+                await run_io(self.store.fail, job["job_id"], worker_id, str(e) or type(e).__name__)
+            finally:
+                heartbeat.cancel()
+
+
+_job_store = None
+_job_store_lock = threading.Lock()
+_worker_pool = None
+
+
+def get_job_store():
+    global _job_store
+    with _job_store_lock:
+        if _job_store is None:
+            _job_store = JobStore()
+    return _job_store
+
+
+async def enqueue_job(job_id, params):
+    await run_io(lambda: get_job_store().create(job_id, params))
+    if _worker_pool is not None:
+        _worker_pool.notify()
+
+
+def get_job(job_id):
+    return get_job_store().get(job_id)
+
+
+def format_sse(seq, event):
+    return f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream_job_events(job_id, after_seq=0, hydrate=None):
+    """Yield Server-Sent Events for a job, replaying history after after_seq, until it finishes.
+
+    hydrate, if given, is called (on the I/O pool) with each stored event and returns the event to send.
+    """
+    store = await run_io(get_job_store)
+    wake = asyncio.Event()
+    listener = (asyncio.get_running_loop(), wake)
+    store.add_listener(job_id, listener)
+    last_sent = time.monotonic()
+    try:
+        while True:
+            wake.clear()
+            events = await run_io(store.get_events, job_id, after_seq)
+            if hydrate is not None and events:
+                events = await run_io(lambda: [(seq, hydrate(event)) for seq, event in events])
+            for seq, event in events:
+                after_seq = seq
+                last_sent = time.monotonic()
+                yield format_sse(seq, event)
+                if event["type"] == "job" and event["status"] in (JOB_COMPLETED, JOB_FAILED):
+                    return
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=JOB_EVENT_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                # The job's events may have been pruned already; end the stream with its final status.
+                job = await run_io(store.get, job_id)
+                if job is None or job["status"] in (JOB_COMPLETED, JOB_FAILED):
+                    event = {"type": "job", "status": job["status"] if job else JOB_FAILED}
+                    if job and job["status"] == JOB_COMPLETED:
+                        event["result_url"] = f"/api/jobs/{job_id}/result"
+                    elif job:
+                        event["error"] = job["error"]
+                    yield format_sse(after_seq, event)
+                    return
+                if time.monotonic() - last_sent >= JOB_EVENT_KEEPALIVE:
+                    last_sent = time.monotonic()
+                    yield ": keepalive\n\n"
+    finally:
+        store.remove_listener(job_id, listener)
+
+
+def start_job_workers(handler, workers=JOB_WORKERS):
+    global _worker_pool
+    if _worker_pool is None:
+        _worker_pool = JobWorkerPool(get_job_store(), handler, workers)
+        _worker_pool.start()
+    return _worker_pool
+
+
+async def stop_job_workers():
+    global _worker_pool
+    if _worker_pool is not None:
+        await _worker_pool.stop()
+        _worker_pool = None
@@ -0,0 +1,43 @@
+import logging
+from fastapi.responses import Response
+from agents.llm_pool import get_llm_pool
+from services.migration_cache import get_open_migration_cache
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = REGISTRY.counter(
+    "migration_cache_lookups_total", "Cache lookups since the process started, by cache and result.", ["cache", "result"]
+)
+CACHE_HIT_RATIO = REGISTRY.gauge("migration_cache_hit_ratio", "Hit ratio since the process started.", ["cache"])
+CACHE_ENTRIES = REGISTRY.gauge("migration_cache_entries", "Per-file results held in the migration cache.")
+CACHE_SIZE_BYTES = REGISTRY.gauge("migration_cache_size_bytes", "Size of the cached per-file results.")
+DEPLOYMENT_IN_FLIGHT = REGISTRY.gauge("llm_deployment_in_flight", "Requests in flight per LLM deployment.", ["deployment"])
+DEPLOYMENT_CIRCUIT_OPEN = REGISTRY.gauge(
+    "llm_deployment_circuit_open", "1 while a deployment's circuit breaker is open.", ["deployment"]
+)
+
+
+def collect_scrape_metrics():
+    # These live on other objects; copy their current values into the registry at scrape time.
+    cache = get_open_migration_cache()
+    if cache is not None:
+        stats = cache.stats()
+        for name, hits, misses in (("migration", stats["hits"], stats["misses"]),
+                                   ("analysis", stats["analysis_hits"], stats["analysis_misses"])):
+            CACHE_LOOKUPS.set(hits, cache=name, result="hit")
+            CACHE_LOOKUPS.set(misses, cache=name, result="miss")
+            CACHE_HIT_RATIO.set(hits / (hits + misses) if hits + misses else 0.0, cache=name)
+        CACHE_ENTRIES.set(stats["entries"])
+        CACHE_SIZE_BYTES.set(stats["size_bytes"])
+    for deployment in get_llm_pool().stats():
+        DEPLOYMENT_IN_FLIGHT.set(deployment["in_flight"], deployment=deployment["name"])
+        DEPLOYMENT_CIRCUIT_OPEN.set(int(deployment["circuit_open"]), deployment=deployment["name"])
+
+
+def get_metrics_response():
+    try:
+        collect_scrape_metrics()
+    except Exception as e:
+        logger.error("Failed to collect scrape-time metrics: %s", str(e))
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -2,23 +2,469 @@ import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-from models.migration import MigrationResult
-from utils.file_utils import prepare_download_links
+from models.migration import MigrationResult, MigrationBatchResult
+from utils.file_utils import prepare_download_links, fingerprint_directory, fingerprint_hashes, scan_tree, link_or_copy
+from utils.async_fs import run_io
 import asyncio
+import functools
+import inspect
+import random
+import time
 from langchain_openai import AzureChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
-from agents.azureopenai_agent import agent, llm
+from agents.llm_pool import get_llm_pool, is_retryable
+from agents.tools import build_directory_index
+from services.migration_cache import get_migration_cache
+from services.chunking import split_into_chunks, file_header, stitch_chunks
+from services.context_selector import build_context_selector
+from services.prefilter import load_rules, classify, ACTION_COPY, ACTION_REWRITE
+from services.review import (
+    REVIEW_REDUCE_FANIN, group_for_review, build_group_review_prompt, build_merge_prompt, build_final_review_prompt,
+    local_group_report, UNREVIEWED_PREFIX
+)
+from services.validation import validate_file
+from utils.rate_limiter import RateLimiter, estimate_tokens
+from utils.metrics import REGISTRY, current_trace, span
 import logging
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Per-file migration tuning
+MIGRATION_CONCURRENCY = int(os.getenv("MIGRATION_CONCURRENCY", "8"))
+MIGRATION_FILE_TIMEOUT = float(os.getenv("MIGRATION_FILE_TIMEOUT", "300"))
+MIGRATION_MAX_RETRIES = int(os.getenv("MIGRATION_MAX_RETRIES", "3"))
+MIGRATION_RETRY_BACKOFF = float(os.getenv("MIGRATION_RETRY_BACKOFF", "2"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+MIGRATION_CACHE_ENABLED = os.getenv("MIGRATION_CACHE_ENABLED", "true").lower() == "true"
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+# Small files that need the model are packed into shared requests of up to MIGRATION_BATCH_TOKEN_BUDGET.
+MIGRATION_BATCH_ENABLED = os.getenv("MIGRATION_BATCH_ENABLED", "true").lower() == "true"
+MIGRATION_BATCH_FILE_TOKENS = int(os.getenv("MIGRATION_BATCH_FILE_TOKENS", "1000"))
+MIGRATION_BATCH_TOKEN_BUDGET = int(os.getenv("MIGRATION_BATCH_TOKEN_BUDGET", "6000"))
+MIGRATION_BATCH_MAX_FILES = int(os.getenv("MIGRATION_BATCH_MAX_FILES", "20"))
+MIGRATION_BATCH_LINGER = float(os.getenv("MIGRATION_BATCH_LINGER", "0.05"))
+# Step 3 review calls in flight at once, and files validated per I/O-pool task.
+REVIEW_CONCURRENCY = int(os.getenv("REVIEW_CONCURRENCY", "8"))
+REVIEW_VALIDATE_BATCH = int(os.getenv("REVIEW_VALIDATE_BATCH", "200"))
+DOCUMENTS_DIR = Path(__file__).parent.parent / "resources/documents"
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "llm_request_seconds", "Time spent in model calls per request, summed over attempts.", ["kind"]
+)
+LLM_QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "llm_queue_wait_seconds", "Time a request waited for a concurrency slot and rate limit budget.", ["kind"]
+)
+LLM_REQUESTS = REGISTRY.counter("llm_requests_total", "Model requests by final outcome.", ["kind", "outcome"])
+LLM_RETRIES = REGISTRY.counter("llm_retries_total", "Model call attempts beyond the first.", ["kind"])
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Estimated prompt and completion tokens.", ["kind", "type"])
+MIGRATION_FILES = REGISTRY.counter("migration_files_total", "Files processed, by outcome.", ["outcome"])
+
+# Bump whenever build_migration_prompt changes so cached results from older prompts are not reused.
+PROMPT_VERSION = "2"
+# process_migration_chunk reports agent failures in-band with this prefix.
+AGENT_ERROR_PREFIX = "Error processing chunk:"
 
 
 def is_code_file(filename):
     CODE_EXTENSIONS = {'.java', '.xml', '.yml', '.yaml', '.properties', '.md', '.txt', '.json', '.js', '.ts', '.py', '.sh', '.bat', '.cmd', '.gradle', '.kts', '.sql'}
     return any(filename.lower().endswith(ext) for ext in CODE_EXTENSIONS)
 
+def build_migration_prompt(file_content, code_language, fro_version, to_version, step1_results, step2_results):
+    migration_prompt = {
+        "context": (
+            f"You are a senior {code_language} developer and code migration assistant. "
+            f"Your task is to update the following file from version {fro_version} to {to_version} for the {code_language} language.\n\n"
+            f"Project Structure Analysis:\n{step1_results}\n\n"
+            f"Version Change Documentation:\n{step2_results}\n\n"
+            "--- BEGIN ORIGINAL FILE CONTENT ---\n"
+            f"{file_content}\n"
+            "--- END ORIGINAL FILE CONTENT ---"
+        ),
+        "instructions": [
+            f"Carefully review the version change documentation and project structure.",
+            f"Convert the code to version {to_version} for {code_language}.",
+            "Make all necessary code, configuration, and syntax changes.",
+            "Ensure the output is fully functional, syntactically correct, and ready to use.",
+            "Do NOT include placeholders, TODOs, or incomplete code.",
+            "Preserve all business logic and comments unless changes are required for compatibility.",
+            "Double-check for syntax errors, missing imports, and migration mistakes.",
+            "Return ONLY the complete, updated file content as plain text in the 'migrated_code' field.",
+            "In the 'summary' field, provide a concise summary (1-3 sentences) of what was changed in this file, and confirm that the code was checked for syntax and migration errors."
+        ]
+    }
+    return json.dumps(migration_prompt)
+
+def build_chunk_prompt(chunk, index, total, header, filename, code_language, fro_version, to_version,
+                       step1_results, step2_results):
+    migration_prompt = {
+        "context": (
+            f"You are a senior {code_language} developer and code migration assistant. "
+            f"Your task is to update part {index + 1} of {total} of the file {filename} from version {fro_version} "
+            f"to {to_version} for the {code_language} language. The other parts are migrated separately and "
+            "concatenated with yours, in order.\n\n"
+            f"Project Structure Analysis:\n{step1_results}\n\n"
+            f"Version Change Documentation:\n{step2_results}\n\n"
+            "--- BEGIN FILE HEADER (context only, do not return it) ---\n"
+            f"{header}\n"
+            "--- END FILE HEADER ---\n\n"
+            "--- BEGIN ORIGINAL CHUNK CONTENT ---\n"
+            f"{chunk}\n"
+            "--- END ORIGINAL CHUNK CONTENT ---"
+        ),
+        "instructions": [
+            f"Convert this chunk to version {to_version} for {code_language}.",
+            "Only change what is inside the chunk; do not add declarations, imports or braces that belong to other parts.",
+            "If the migration needs new imports and this chunk holds the imports, add them here.",
+            "Preserve all business logic and comments unless changes are required for compatibility.",
+            "Do NOT include placeholders, TODOs, or incomplete code.",
+            "Return ONLY the updated chunk content as plain text in the 'migrated_code' field.",
+            "In the 'summary' field, provide a concise summary (1 sentence) of what was changed in this chunk."
+        ]
+    }
+    return json.dumps(migration_prompt)
+
+def build_batch_prompt(files, code_language, fro_version, to_version, step1_results, step2_results):
+    migration_prompt = {
+        "context": (
+            f"You are a senior {code_language} developer and code migration assistant. "
+            f"Your task is to update each of the files listed in 'files' from version {fro_version} to {to_version} "
+            f"for the {code_language} language. The files are independent of each other.\n\n"
+            f"Project Structure Analysis:\n{step1_results}\n\n"
+            f"Version Change Documentation:\n{step2_results}"
+        ),
+        "files": [{"path": path, "content": content} for path, content in files],
+        "instructions": [
+            f"Convert every file to version {to_version} for {code_language}.",
+            "Make all necessary code, configuration, and syntax changes.",
+            "Preserve all business logic and comments unless changes are required for compatibility.",
+            "Do NOT include placeholders, TODOs, or incomplete code.",
+            "Return exactly one entry per input file in 'files', with its 'path' copied exactly as given.",
+            "Put the complete, updated file content as plain text in its 'migrated_code' field, or the original content if nothing needs to change.",
+            "In its 'summary' field, provide a concise summary (1-2 sentences) of what was changed in that file."
+        ]
+    }
+    return json.dumps(migration_prompt)
+
+def read_source_file(src_file):
+    try:
+        with open(src_file, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception:
+        with open(src_file, "rb") as f:
+            return f.read().decode("utf-8", errors="replace")
+
+def record_llm_call(kind, label, started_at, seconds, queue_wait, latency, attempts, prompt_tokens,
+                    completion_tokens, outcome):
+    LLM_QUEUE_WAIT_SECONDS.observe(queue_wait, kind=kind)
+    LLM_REQUEST_SECONDS.observe(latency, kind=kind)
+    LLM_REQUESTS.inc(kind=kind, outcome=outcome)
+    LLM_RETRIES.inc(max(attempts - 1, 0), kind=kind)
+    LLM_TOKENS.inc(prompt_tokens, kind=kind, type="prompt")
+    LLM_TOKENS.inc(completion_tokens, kind=kind, type="completion")
+    trace = current_trace()
+    if trace is not None:
+        trace.add(
+            "llm_call", seconds, started_at=started_at, kind=kind, label=label, queue_wait=round(queue_wait, 4),
+            latency=round(latency, 4), attempts=attempts, prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens, outcome=outcome
+        )
+
+async def invoke_with_retries(structured_llm, prompt, semaphore, rate_limiter, label, kind="file"):
+    # Token counts are estimates: structured output does not surface the provider's usage data.
+    prompt_tokens = estimate_tokens(prompt)
+    completion_tokens = attempts = 0
+    queue_wait = latency = 0.0
+    outcome = "error"
+    started_at = time.time()
+    start = waiting_since = time.perf_counter()
+    try:
+        async with semaphore:
+            for attempt in range(1, MIGRATION_MAX_RETRIES + 1):
+                await rate_limiter.acquire(prompt_tokens)
+                call_start = time.perf_counter()
+                queue_wait += call_start - waiting_since
+                attempts = attempt
+                try:
+                    result = await asyncio.wait_for(structured_llm.ainvoke(prompt), timeout=MIGRATION_FILE_TIMEOUT)
+                except Exception as e:
+                    latency += time.perf_counter() - call_start
+                    # A bad request (400, content filter, schema mismatch) fails the same way every time.
+                    if attempt == MIGRATION_MAX_RETRIES or not is_retryable(e):
+                        raise
+                    delay = MIGRATION_RETRY_BACKOFF * (2 ** (attempt - 1)) + random.uniform(0, 1)
+                    logger.warning("Attempt %d/%d failed for %s: %s (retrying in %.1fs)",
+                                   attempt, MIGRATION_MAX_RETRIES, label, str(e) or type(e).__name__, delay)
+                    await asyncio.sleep(delay)
+                    waiting_since = time.perf_counter()
+                else:
+                    latency += time.perf_counter() - call_start
+                    completion_tokens = estimate_tokens(result.model_dump_json())
+                    outcome = "ok"
+                    return result
+    finally:
+        record_llm_call(kind, label, started_at, time.perf_counter() - start, queue_wait, latency, attempts,
+                        prompt_tokens, completion_tokens, outcome)
+
+async def cache_get(cache, cache_key, label):
+    """Cache lookup off the event loop; a cache error counts as a miss so it never fails the file."""
+    try:
+        return await run_io(cache.get, cache_key)
+    except Exception as e:
+        logger.warning("Cache read failed for %s: %s", label, str(e) or type(e).__name__)
+        return None
+
+async def cache_put(cache, cache_key, result, label):
+    """Store a result off the event loop; if the cache rejects it the result is still used, just not cached."""
+    try:
+        await run_io(cache.put, cache_key, result)
+    except Exception as e:
+        logger.warning("Cache write failed for %s: %s", label, str(e) or type(e).__name__)
+
+async def migrate_prompt_cached(structured_llm, semaphore, rate_limiter, cache, cache_key, prompt, label, kind="file",
+                                cache_checked=False):
+    # cache_checked: the caller already missed on cache_key, so a second lookup would only count another miss.
+    if cache is not None and not cache_checked:
+        result = await cache_get(cache, cache_key, label)
+        if result is not None:
+            logger.info("Cache hit for %s", label)
+            return result
+    result = await invoke_with_retries(structured_llm, prompt, semaphore, rate_limiter, label, kind)
+    if cache is not None:
+        await cache_put(cache, cache_key, result, label)
+    return result
+
+async def migrate_chunked(structured_llm, semaphore, rate_limiter, cache, chunks, file_content, src_file,
+                          code_language, fro_version, to_version, step1_context, step2_context):
+    file = os.path.basename(src_file)
+    header = file_header(file_content)
+
+    async def migrate_chunk(index, chunk):
+        label = f"{src_file} [chunk {index + 1}/{len(chunks)}]"
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(
+                chunk, code_language, fro_version, to_version, f"{PROMPT_VERSION}:chunk", get_llm_pool().model_name
+            )
+        prompt = build_chunk_prompt(chunk, index, len(chunks), header, file, code_language, fro_version,
+                                    to_version, step1_context, step2_context)
+        try:
+            return await migrate_prompt_cached(structured_llm, semaphore, rate_limiter, cache, cache_key, prompt, label,
+                                               kind="chunk")
+        except Exception as e:
+            # Successful chunks are cached, so a re-run only repeats the chunks that failed.
+            logger.error("Migration failed for %s: %s", label, str(e) or type(e).__name__)
+            return None
+
+    results = await asyncio.gather(*(migrate_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+    failed = [i + 1 for i, result in enumerate(results) if result is None]
+    migrated = [chunk if result is None else result.migrated_code for chunk, result in zip(chunks, results)]
+    summaries = [result.summary for result in results if result is not None]
+    summary = f"Migrated in {len(chunks)} chunks. " + " ".join(dict.fromkeys(summaries))
+    if failed:
+        summary += f" Chunk(s) {', '.join(map(str, failed))} failed and were kept unchanged."
+    return MigrationResult(migrated_code=stitch_chunks(chunks, migrated), summary=summary.strip()), not failed
+
+class MigrationBatcher:
+    """Packs small files into shared structured requests so the common context is sent once per batch.
+
+    Files are collected until the batch reaches its token or file budget, or MIGRATION_BATCH_LINGER seconds
+    pass. submit() resolves to the file's MigrationResult, or to None when the batch failed or left the file
+    out; the caller then migrates that file on its own.
+    """
+
+    def __init__(self, semaphore, rate_limiter, cache, context_selector, code_language, fro_version, to_version):
+        self.structured_llm = get_llm_pool().structured(MigrationBatchResult)
+        self.semaphore = semaphore
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.context_selector = context_selector
+        self.code_language = code_language
+        self.fro_version = fro_version
+        self.to_version = to_version
+        self.pending = []
+        self.pending_tokens = 0
+        self.timer = None
+        self.tasks = set()
+
+    def accepts(self, file_content):
+        return estimate_tokens(file_content) <= MIGRATION_BATCH_FILE_TOKENS
+
+    async def submit(self, path, file_content, cache_key):
+        if self.cache is not None:
+            cached = await cache_get(self.cache, cache_key, path)
+            if cached is not None:
+                logger.info("Cache hit for %s", path)
+                return cached
+        tokens = estimate_tokens(file_content)
+        if self.pending and (self.pending_tokens + tokens > MIGRATION_BATCH_TOKEN_BUDGET
+                             or len(self.pending) >= MIGRATION_BATCH_MAX_FILES):
+            self.flush()
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((path, file_content, cache_key, future))
+        self.pending_tokens += tokens
+        if self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(MIGRATION_BATCH_LINGER, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending, self.pending_tokens = self.pending, [], 0
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self.run_batch(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        for task in self.tasks:
+            task.cancel()
+
+    async def run_batch(self, batch):
+        results = {}
+        try:
+            # A lone file gains nothing from batching and gets a better-targeted context on its own.
+            if len(batch) > 1:
+                label = f"batch of {len(batch)} files"
+                step1_context, step2_context = self.context_selector.select(
+                    "\n".join(file_content for _, file_content, _, _ in batch)
+                )
+                prompt = build_batch_prompt(
+                    [(path, file_content) for path, file_content, _, _ in batch],
+                    self.code_language, self.fro_version, self.to_version, step1_context, step2_context
+                )
+                try:
+                    response = await invoke_with_retries(self.structured_llm, prompt, self.semaphore,
+                                                         self.rate_limiter, label, kind="batch")
+                    results = {entry.path: entry for entry in response.files}
+                except Exception as e:
+                    logger.warning("Migration failed for %s, migrating its files one by one: %s",
+                                   label, str(e) or type(e).__name__)
+                missing = [path for path, _, _, _ in batch if path not in results]
+                if results and missing:
+                    logger.warning("Batch response left out %d file(s): %s", len(missing), ", ".join(missing))
+            for path, _, cache_key, future in batch:
+                entry = results.get(path)
+                result = MigrationResult(migrated_code=entry.migrated_code, summary=entry.summary) if entry else None
+                if result is not None and self.cache is not None:
+                    await cache_put(self.cache, cache_key, result, path)
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+async def migrate_code_file(structured_llm, semaphore, rate_limiter, src_file, dst_file,
+                            code_language, fro_version, to_version, context_selector, rules=None,
+                            batcher=None, rel_path=None):
+    file = os.path.basename(src_file)
+    file_content = await run_io(read_source_file, src_file)
+    if rules is not None:
+        decision = classify(file_content, file, rules)
+        if decision.action == ACTION_COPY:
+            logger.info("Prefilter: nothing version-sensitive in %s, copying", src_file)
+            return await copy_non_code_file(src_file, dst_file, summary=decision.summary())
+        if decision.action == ACTION_REWRITE:
+            logger.info("Prefilter: applying mechanical rewrites to %s without LLM", src_file)
+            result = MigrationResult(migrated_code=decision.content, summary=decision.summary())
+            return await run_io(write_migration_result, src_file, dst_file, result)
+        # Hand the model the locally rewritten content so it only has to deal with the flagged constructs.
+        file_content = decision.content
+    logger.info("Migrating code file: %s", src_file)
+    step1_context, step2_context = context_selector.select(file_content)
+    cache = get_migration_cache() if MIGRATION_CACHE_ENABLED else None
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(file_content, code_language, fro_version, to_version, PROMPT_VERSION, get_llm_pool().model_name)
+    chunks = split_into_chunks(file_content, file)
+    failed = False
+    try:
+        result = None
+        batched = batcher is not None and len(chunks) == 1 and batcher.accepts(file_content)
+        if batched:
+            # submit() looks the file up in the cache first; None means a miss and a dropped or failed batch.
+            result = await batcher.submit(rel_path or file, file_content, cache_key)
+        if result is not None:
+            logger.info("Migrated %s as part of a batch", src_file)
+        elif len(chunks) == 1:
+            prompt = build_migration_prompt(file_content, code_language, fro_version, to_version, step1_context, step2_context)
+            result = await migrate_prompt_cached(structured_llm, semaphore, rate_limiter, cache, cache_key, prompt,
+                                                 rel_path or src_file, cache_checked=batched)
+        else:
+            result = await cache_get(cache, cache_key, rel_path or src_file) if cache is not None else None
+            if result is None:
+                result, complete = await migrate_chunked(
+                    structured_llm, semaphore, rate_limiter, cache, chunks, file_content, rel_path or src_file,
+                    code_language, fro_version, to_version, step1_context, step2_context
+                )
+                if cache is not None and complete:
+                    await cache_put(cache, cache_key, result, rel_path or src_file)
+                failed = not complete
+    except Exception as e:
+        # Keep the output tree complete: fall back to the original content for this file.
+        logger.error("Migration failed for %s: %s", src_file, str(e) or type(e).__name__)
+        result = MigrationResult(
+            migrated_code=file_content,
+            summary=f"Migration failed after {MIGRATION_MAX_RETRIES} attempt(s), original file kept: {str(e) or type(e).__name__}"
+        )
+        failed = True
+    summary = await run_io(write_migration_result, src_file, dst_file, result)
+    if failed:
+        # Kept out of the job manifest, so an incremental job based on this one migrates the file again.
+        summary["failed"] = True
+    return summary
+
+def write_migration_result(src_file, dst_file, result):
+    try:
+        # dst_file may be a hard link into a previous job's output; never write through it.
+        Path(dst_file).unlink(missing_ok=True)
+        with open(dst_file, "w", encoding="utf-8") as f:
+            f.write(result.migrated_code)
+        logger.info("Migration result written to: %s", dst_file)
+    except Exception as e:
+        logger.error("Error migrating file %s: %s", src_file, str(e))
+        return {
+            "filename": os.path.basename(src_file),
+            "summary": f"Migration failed, output could not be written: {e}",
+            "migrated_code": result.migrated_code,
+            "failed": True
+        }
+    return {
+        "filename": os.path.basename(src_file),
+        "summary": result.summary,
+        "migrated_code": result.migrated_code
+    }
+
+async def copy_non_code_file(src_file, dst_file, summary="No migration needed, file copied as-is."):
+    file = os.path.basename(src_file)
+    try:
+        # Outputs are only ever replaced (unlink + create), never written in place, so sharing blocks is safe.
+        await run_io(link_or_copy, src_file, dst_file)
+        logger.info("Copied non-code file: %s", src_file)
+        return {
+            "filename": file,
+            "summary": summary,
+            "migrated_code": None
+        }
+    except Exception as e:
+        logger.error("Failed to copy file %s: %s", src_file, str(e))
+        return {
+            "filename": file,
+            "summary": f"Copy failed: {e}",
+            "migrated_code": None,
+            "failed": True
+        }
+
+def is_agent_error(text):
+    """True for in-band agent errors and for Step 3 summaries put together without an LLM review."""
+    return text is None or text.startswith((AGENT_ERROR_PREFIX, UNREVIEWED_PREFIX))
+
 async def process_migration_chunk(chunk_prompt: str, timeout: int = 300) -> str:
     logger.info("Processing migration chunk with timeout %d", timeout)
     messages = [
@@ -27,17 +473,176 @@ async def process_migration_chunk(chunk_prompt: str, timeout: int = 300) -> str:
     ]
     try:
         response = await asyncio.wait_for(
-            agent.ainvoke({"messages": messages}, config={"recursion_limit": 50}),
+            get_llm_pool().agent().ainvoke({"messages": messages}, config={"recursion_limit": 50}),
             timeout=timeout
         )
         logger.info("Chunk processed successfully")
         return str(response["messages"][-1].content)
     except Exception as e:
         logger.error("Error processing chunk: %s", str(e))
-        return f"Error processing chunk: {str(e)}"
+        return f"{AGENT_ERROR_PREFIX} {str(e)}"
+
+async def reuse_base_output(base_file, src_file, dst_file, prior, fallback):
+    """Reuse the base job's output for an unchanged file; fallback() processes it instead if that output is gone."""
+    file = os.path.basename(src_file)
+    if not await run_io(os.path.isfile, base_file):
+        logger.info("Base job output missing for %s, processing it again", src_file)
+        return await fallback()
+    try:
+        await run_io(link_or_copy, base_file, dst_file)
+        logger.info("Reused unchanged file from base job: %s", src_file)
+    except Exception as e:
+        logger.error("Failed to reuse %s: %s", base_file, str(e))
+        return {"filename": file, "summary": f"Copy failed: {e}", "migrated_code": None, "failed": True}
+    return {
+        "filename": file,
+        "summary": prior["summary"],
+        "migrated_code": await run_io(read_source_file, dst_file) if prior["migrated"] else None,
+        "reused": True
+    }
+
+async def emit_event(on_event, event):
+    if on_event is None:
+        return
+    try:
+        result = on_event(event)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        logger.error("Event handler failed for %s event: %s", event.get("type"), str(e))
+
+async def track_file(coro, on_event, index, rel_path, source_hash):
+    summary = await coro
+    if summary.get("reused"):
+        outcome = "reused"
+    elif summary.get("failed"):
+        outcome = "failed"
+    else:
+        outcome = "copied" if summary["migrated_code"] is None else "migrated"
+    MIGRATION_FILES.inc(outcome=outcome)
+    summary["path"] = rel_path
+    summary["source_hash"] = source_hash
+    await emit_event(on_event, {"type": "file", "index": index, **summary})
+    return summary
+
+# Analysis keys currently being computed, so concurrent jobs share one agent run per key.
+_analysis_inflight = {}
+
+async def run_cached_analysis(step, cache_parts, prompt, timeout=400):
+    if not ANALYSIS_CACHE_ENABLED:
+        return await process_migration_chunk(prompt, timeout=timeout)
+    cache = get_migration_cache()
+    key = cache.make_analysis_key(step, PROMPT_VERSION, get_llm_pool().model_name, *cache_parts)
+    try:
+        cached = await run_io(cache.get_analysis, key)
+    except Exception as e:
+        logger.warning("Cache read failed for %s analysis: %s", step, str(e) or type(e).__name__)
+        cached = None
+    if cached is not None:
+        logger.info("Reusing cached %s analysis", step)
+        return cached
+    if key in _analysis_inflight:
+        logger.info("Waiting for in-flight %s analysis", step)
+        return await asyncio.shield(_analysis_inflight[key])
+    future = asyncio.get_running_loop().create_future()
+    _analysis_inflight[key] = future
+    try:
+        try:
+            result = await process_migration_chunk(prompt, timeout=timeout)
+        except BaseException:
+            future.cancel()
+            raise
+        future.set_result(result)
+        # process_migration_chunk reports failures in-band; never cache those. The key stays in flight until the
+        # result is stored, so a caller arriving meanwhile waits instead of starting another agent run.
+        if not is_agent_error(result):
+            try:
+                await run_io(cache.put_analysis, key, step, result)
+            except Exception as e:
+                logger.warning("Could not cache %s analysis: %s", step, str(e) or type(e).__name__)
+    finally:
+        _analysis_inflight.pop(key, None)
+    return result
+
+def validate_entries(entries):
+    """Replace each entry's migrated_code with the syntax issues local parsers find in it; returns the issue count."""
+    issues = 0
+    for entry in entries:
+        entry["issues"] = validate_file(entry["filename"], entry.pop("migrated_code", None))
+        issues += len(entry["issues"])
+    return issues
+
+async def review_group(group, semaphore, code_language, to_version):
+    async with semaphore:
+        with span("review_group", files=len(group["files"])):
+            report = await process_migration_chunk(build_group_review_prompt(group, code_language, to_version), timeout=400)
+    if is_agent_error(report):
+        logger.warning("Review of %s failed, keeping its file summaries instead", group["directory"])
+        return local_group_report(group)
+    return report
+
+async def merge_reports(reports, semaphore, code_language, to_version):
+    if len(reports) == 1:
+        return reports[0]
+    async with semaphore:
+        with span("review_merge", reports=len(reports)):
+            merged = await process_migration_chunk(build_merge_prompt(reports, code_language, to_version), timeout=400)
+    if is_agent_error(merged):
+        logger.warning("Merging %d review reports failed, passing them on unmerged", len(reports))
+        return "\n\n".join(reports)
+    return merged
 
-async def run_migration_agent(uploads_dir, downloads_dir, code_language, fro_version, to_version):
+async def review_migrated_files(entries, code_language, to_version, base_summary=None):
+    """Step 3 as map-reduce: validate locally, review directory groups in parallel, merge the reports in rounds.
+
+    A project that fits in one group is reviewed with a single call, as before.
+    """
+    with span("review_validate", files=len(entries)) as attrs:
+        counts = await asyncio.gather(*(
+            run_io(validate_entries, entries[i:i + REVIEW_VALIDATE_BATCH])
+            for i in range(0, len(entries), REVIEW_VALIDATE_BATCH)
+        ))
+        attrs["issues"] = sum(counts)
+    logger.info("Local validation found %d syntax issues in %d files", sum(counts), len(entries))
+    groups = group_for_review(entries)
+    if len(groups) <= 1:
+        prompt = build_final_review_prompt(code_language, to_version, files=entries, base_summary=base_summary)
+        summary = await process_migration_chunk(prompt, timeout=400)
+        if is_agent_error(summary) and groups:
+            return local_group_report(groups[0])
+        return summary
+    logger.info("Reviewing %d files in %d groups", len(entries), len(groups))
+    semaphore = asyncio.Semaphore(REVIEW_CONCURRENCY)
+    reports = list(await asyncio.gather(*(review_group(group, semaphore, code_language, to_version) for group in groups)))
+    while len(reports) > REVIEW_REDUCE_FANIN:
+        reports = list(await asyncio.gather(*(
+            merge_reports(reports[i:i + REVIEW_REDUCE_FANIN], semaphore, code_language, to_version)
+            for i in range(0, len(reports), REVIEW_REDUCE_FANIN)
+        )))
+    prompt = build_final_review_prompt(code_language, to_version, reports=reports, base_summary=base_summary)
+    summary = await process_migration_chunk(prompt, timeout=400)
+    if is_agent_error(summary):
+        logger.warning("Final review merge failed, returning the group reports")
+        return f"{UNREVIEWED_PREFIX} for the whole project; reports per part:\n\n" + "\n\n".join(reports)
+    return summary
+
+async def run_migration_agent(uploads_dir, downloads_dir, code_language, fro_version, to_version, on_event=None,
+                              base=None):
+    """Migrate every file under uploads_dir into downloads_dir.
+
+    on_event, if given, is called (sync or async) with a dict for each step
+    transition and each finished file, which lets callers report progress.
+    base, if given, is the manifest of a previous job (see services.job_manifest):
+    files whose content is unchanged reuse that job's output and summary.
+    """
     logger.info("Starting migration agent for %s -> %s (%s)", fro_version, to_version, code_language)
+    await emit_event(on_event, {"type": "step", "step": 1, "status": "started"})
+    # One walk (off the event loop) mirrors the tree, hashes every file and yields Step 1's cache fingerprint.
+    with span("scan") as attrs:
+        entries = await run_io(scan_tree, uploads_dir, downloads_dir)
+        attrs["files"] = len(entries)
+        # The agent's directory tools answer from this index instead of walking the tree on each call.
+        await run_io(build_directory_index, uploads_dir)
     # Step 1: Analyze Project Structure
     step1_prompt = f"""
     STEP 1: Analyze Project Structure for Code Migration
@@ -46,118 +651,90 @@ async def run_migration_agent(uploads_dir, downloads_dir, code_language, fro_ver
     - return a summary of the project structure and key points to be noted for migration
     Focus ONLY on understanding the project structure in this step.
     """
-    step1_result = await process_migration_chunk(step1_prompt, timeout=400)
+    uploads_fingerprint = fingerprint_hashes((rel_path, source_hash) for _, _, rel_path, source_hash in entries)
+    with span("step1"):
+        step1_result = await run_cached_analysis("step1", [uploads_fingerprint], step1_prompt)
     logger.info("Step 1 (structure analysis) complete")
+    await emit_event(on_event, {"type": "step", "step": 1, "status": "completed"})
+    await emit_event(on_event, {"type": "step", "step": 2, "status": "started"})
 
     # Step 2: Review Version Documentation
     step2_prompt = f"""
     STEP 2: Review Version Documentation
-    - Check the documentation for version changes in: {str(Path(__file__).parent.parent / 'documents')}
+    - Check the documentation for version changes in: {str(DOCUMENTS_DIR)}
     - Identify key changes needed for migrating from {fro_version} to {to_version} in {code_language}
     - List the main changes and migration steps needed
     Focus ONLY on understanding the version changes in this step.
     """
-    step2_result = await process_migration_chunk(step2_prompt, timeout=400)
+    with span("step2"):
+        documents_fingerprint = await run_io(fingerprint_directory, DOCUMENTS_DIR)
+        step2_result = await run_cached_analysis(
+            "step2", [code_language, fro_version, to_version, documents_fingerprint], step2_prompt
+        )
     logger.info("Step 2 (version doc review) complete")
+    await emit_event(on_event, {"type": "step", "step": 2, "status": "completed"})
 
     step1_results = f"Step 1 Results:\n{step1_result}"
     step2_results = f"Step 2 Results:\n{step2_result}"
+    # Each file's prompt gets only the passages of these results (and the docs) relevant to it.
+    context_selector = await run_io(build_context_selector, step1_results, step2_results, DOCUMENTS_DIR, documents_fingerprint)
+    rules = await run_io(load_rules, code_language, fro_version, to_version)
 
     # Per-file migration
-    migration_summaries = []
-    structured_llm = llm.with_structured_output(MigrationResult)
-    for root, dirs, files in os.walk(uploads_dir):
-        rel_dir = os.path.relpath(root, uploads_dir)
-        dst_dir = os.path.join(downloads_dir, rel_dir) if rel_dir != '.' else downloads_dir
-        os.makedirs(dst_dir, exist_ok=True)
-        for file in files:
-            src_file = os.path.join(root, file)
-            dst_file = os.path.join(dst_dir, file)
-            if is_code_file(file):
-                logger.info("Migrating code file: %s", src_file)
-                try:
-                    with open(src_file, "r", encoding="utf-8") as f:
-                        file_content = f.read()
-                except Exception:
-                    with open(src_file, "rb") as f:
-                        file_content = f.read().decode("utf-8", errors="replace")
-                migration_prompt = {
-                    "context": (
-                        f"You are a senior {code_language} developer and code migration assistant. "
-                        f"Your task is to update the following file from version {fro_version} to {to_version} for the {code_language} language.\n\n"
-                        f"Project Structure Analysis:\n{step1_results}\n\n"
-                        f"Version Change Documentation:\n{step2_results}\n\n"
-                        "--- BEGIN ORIGINAL FILE CONTENT ---\n"
-                        f"{file_content}\n"
-                        "--- END ORIGINAL FILE CONTENT ---"
-                    ),
-                    "instructions": [
-                        f"Carefully review the version change documentation and project structure.",
-                        f"Convert the code to version {to_version} for {code_language}.",
-                        "Make all necessary code, configuration, and syntax changes.",
-                        "Ensure the output is fully functional, syntactically correct, and ready to use.",
-                        "Do NOT include placeholders, TODOs, or incomplete code.",
-                        "Preserve all business logic and comments unless changes are required for compatibility.",
-                        "Double-check for syntax errors, missing imports, and migration mistakes.",
-                        "Return ONLY the complete, updated file content as plain text in the 'migrated_code' field.",
-                        "In the 'summary' field, provide a concise summary (1-3 sentences) of what was changed in this file, and confirm that the code was checked for syntax and migration errors."
-                    ]
-                }
-                result = await structured_llm.ainvoke(json.dumps(migration_prompt))
-                try:
-                    with open(dst_file, "w", encoding="utf-8") as f:
-                        f.write(result.migrated_code)
-                    logger.info("Migration result written to: %s", dst_file)
-                except Exception as e:
-                    logger.error("Error migrating file %s: %s", src_file, str(e))
-                migration_summaries.append({
-                    "filename": file,
-                    "summary": result.summary,
-                    "migrated_code": result.migrated_code
-                })
-            else:
-                try:
-                    with open(src_file, "rb") as src_f, open(dst_file, "wb") as dst_f:
-                        dst_f.write(src_f.read())
-                    logger.info("Copied non-code file: %s", src_file)
-                    migration_summaries.append({
-                        "filename": file,
-                        "summary": "No migration needed, file copied as-is.",
-                        "migrated_code": None
-                    })
-                except Exception as e:
-                    logger.error("Failed to copy file %s: %s", src_file, str(e))
-                    migration_summaries.append({
-                        "filename": file,
-                        "summary": f"Copy failed: {e}",
-                        "migrated_code": None
-                    })
+    structured_llm = get_llm_pool().structured(MigrationResult)
+    semaphore = asyncio.Semaphore(MIGRATION_CONCURRENCY)
+    rate_limiter = RateLimiter(LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+    batcher = None
+    if MIGRATION_BATCH_ENABLED:
+        batcher = MigrationBatcher(
+            semaphore, rate_limiter, get_migration_cache() if MIGRATION_CACHE_ENABLED else None, context_selector,
+            code_language, fro_version, to_version
+        )
+    tasks = []
+    # scan_tree walks in sorted order, so migration_summaries is deterministic.
+    for src_file, dst_file, rel_path, source_hash in entries:
+        prior = base["files"].get(rel_path) if base else None
+        base_file = os.path.join(base["downloads_dir"], rel_path) if prior else None
+        if is_code_file(os.path.basename(src_file)):
+            process = functools.partial(
+                migrate_code_file, structured_llm, semaphore, rate_limiter, src_file, dst_file,
+                code_language, fro_version, to_version, context_selector, rules, batcher, rel_path
+            )
+        else:
+            process = functools.partial(copy_non_code_file, src_file, dst_file)
+        if prior and prior["hash"] == source_hash:
+            task = reuse_base_output(base_file, src_file, dst_file, prior, process)
+        else:
+            task = process()
+        tasks.append(track_file(task, on_event, len(tasks), rel_path, source_hash))
+    await emit_event(on_event, {"type": "files_discovered", "total_files": len(tasks)})
+    # gather() preserves task order, so summaries follow the walk order regardless of completion order.
+    with span("migrate_files", files=len(tasks)):
+        try:
+            migration_summaries = list(await asyncio.gather(*tasks))
+        finally:
+            if batcher is not None:
+                batcher.close()
 
     # Step 3: Review all migrated code and summarize
-    step3_prompt = f"""
-    STEP 3: Review Migrated Project Files
-
-    You are to review the following migrated files for any issues, including:
-    - Syntax errors
-    - Annotation errors
-    - Variable naming or usage issues
-    - Any other migration mistakes
-
-    Here is the list of migrated files and their summaries:
-    {json.dumps([{k: v for k, v in summary.items() if k != "migrated_code"} for summary in migration_summaries], indent=2)}
-
-    For each file, check the migrated code for correctness and compatibility with {to_version} of {code_language}.
-    Then, provide a final summary with:
-    - A list of filenames that were updated (no paths, just names)
-    - An overview of the application or code after migration
-    - Any issues found and suggestions for fixes
-
-    Do NOT include any file paths in your summary.
-    """
-
-    step3_result = await process_migration_chunk(step3_prompt, timeout=400)
+    await emit_event(on_event, {"type": "step", "step": 3, "status": "started"})
+    # Files reused from a base job were reviewed with it; only the delta needs another look. A base job
+    # without a usable review (its Step 3 failed) gets everything reviewed again.
+    base_summary = base["summary"] if base and not is_agent_error(base["summary"]) else None
+    review_entries = [
+        {"path": summary["path"], "filename": summary["filename"], "summary": summary["summary"],
+         "migrated_code": summary["migrated_code"]}
+        for summary in migration_summaries if not (summary.get("reused") and base_summary)
+    ]
+    if base_summary and not review_entries:
+        logger.info("No changed files since base job, reusing its review")
+        step3_result = base_summary
+    else:
+        with span("step3", files=len(review_entries)):
+            step3_result = await review_migrated_files(review_entries, code_language, to_version, base_summary)
     logger.info("Step 3 (summary) complete")
+    await emit_event(on_event, {"type": "step", "step": 3, "status": "completed"})
     summary = step3_result
-    download_links = prepare_download_links(downloads_dir)
+    download_links = await run_io(prepare_download_links, downloads_dir)
     logger.info("Migration agent finished for job.")
     return summary, download_links, migration_summaries
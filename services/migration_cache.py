@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from models.migration import MigrationResult
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_CACHE_PATH = os.getenv(
+    "MIGRATION_CACHE_PATH", str(Path(__file__).parent.parent / "resources/cache/migration_cache.db")
+)
+MIGRATION_CACHE_MAX_BYTES = int(os.getenv("MIGRATION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def content_hash(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8", errors="replace")
+    return hashlib.sha256(content).hexdigest()
+
+
+class MigrationCache:
+    """Persistent SQLite cache of per-file MigrationResults with size-bounded LRU eviction."""
+
+    def __init__(self, path=MIGRATION_CACHE_PATH, max_bytes=MIGRATION_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.analysis_hits = 0
+        self.analysis_misses = 0
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS migration_results ("
+            " cache_key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_migration_results_access ON migration_results (last_access)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_results ("
+            " cache_key TEXT PRIMARY KEY,"
+            " step TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(file_content, code_language, fro_version, to_version, prompt_version, model):
+        parts = [content_hash(file_content), code_language, fro_version, to_version, prompt_version, model or ""]
+        return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM migration_results WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE migration_results SET last_access = ? WHERE cache_key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return MigrationResult(**json.loads(row[0]))
+
+    def put(self, key, result):
+        value = json.dumps(result.model_dump())
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            logger.info("Skipping cache store, entry of %d bytes exceeds cache size", size)
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO migration_results (cache_key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM migration_results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self._conn.execute(
+            "SELECT cache_key, size FROM migration_results ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM migration_results WHERE cache_key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.info("Evicted %d migration cache entries", evicted)
+
+    @staticmethod
+    def make_analysis_key(step, *parts):
+        return hashlib.sha256("\x1f".join([step] + [str(p) for p in parts]).encode("utf-8")).hexdigest()
+
+    def get_analysis(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM analysis_results WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.analysis_misses += 1
+                return None
+            self.analysis_hits += 1
+        return row[0]
+
+    def put_analysis(self, key, step, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis_results (cache_key, step, value, created_at) VALUES (?, ?, ?, ?)",
+                (key, step, value, time.time()),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM migration_results"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": total,
+            "max_bytes": self.max_bytes,
+            "analysis_hits": self.analysis_hits,
+            "analysis_misses": self.analysis_misses,
+        }
+
+
+_migration_cache = None
+_migration_cache_lock = threading.Lock()
+
+
+def get_open_migration_cache():
+    """The cache if something has opened it already, without opening it (for metrics scrapes)."""
+    return _migration_cache
+
+
+def get_migration_cache():
+    global _migration_cache
+    with _migration_cache_lock:
+        if _migration_cache is None:
+            _migration_cache = MigrationCache()
+            logger.info("Migration cache opened at %s", _migration_cache.path)
+    return _migration_cache
@@ -0,0 +1,118 @@
+import json
+import os
+import re
+import logging
+from functools import lru_cache
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "true").lower() == "true"
+RULES_DIR = Path(os.getenv("RULES_DIR", str(Path(__file__).parent.parent / "resources/rules")))
+
+ACTION_LLM = "llm"
+ACTION_REWRITE = "rewrite"
+ACTION_COPY = "copy"
+
+# "8", "1.8", "17", "Java 11", "JDK 21"...; the language default rules only cover JDK upgrades.
+JDK_VERSION_RE = re.compile(r"^(java|jdk|openjdk)?(1\.[0-9]|[5-9]|[1-9][0-9])(\.[0-9]+)*$")
+
+
+def _normalize(value):
+    return re.sub(r"[^a-z0-9.]+", "", str(value).lower())
+
+
+class Rule:
+    def __init__(self, spec):
+        self.name = spec["name"]
+        self.pattern = re.compile(spec["pattern"], re.MULTILINE)
+        self.replacement = spec.get("replacement")
+        self.extensions = {ext.lower() for ext in spec.get("extensions", [])}
+
+    def applies_to(self, filename):
+        return not self.extensions or os.path.splitext(filename.lower())[1] in self.extensions
+
+
+class RuleSet:
+    def __init__(self, source, rewrites, triggers):
+        self.source = source
+        self.rewrites = rewrites
+        self.triggers = triggers
+
+
+class PrefilterDecision:
+    def __init__(self, action, content, triggers, rewrites):
+        self.action = action
+        self.content = content
+        self.triggers = triggers
+        self.rewrites = rewrites
+
+    def summary(self):
+        if self.action == ACTION_REWRITE:
+            return "Applied mechanical rewrites without LLM: " + "; ".join(self.rewrites) + "."
+        return "No version-sensitive constructs found, file copied as-is."
+
+
+def is_jdk_version(version):
+    return bool(JDK_VERSION_RE.match(_normalize(version)))
+
+
+def rules_file_candidates(code_language, fro_version, to_version):
+    language_dir = RULES_DIR / _normalize(code_language)
+    candidates = [language_dir / f"{_normalize(fro_version)}_to_{_normalize(to_version)}.json"]
+    # Framework upgrades (e.g. Spring Boot 2 -> 3) change far more than the JDK default rules know about;
+    # without a pair-specific file every file goes to the LLM rather than being copied on a rule miss.
+    if is_jdk_version(fro_version) and is_jdk_version(to_version):
+        candidates.append(language_dir / "default.json")
+    return candidates
+
+
+def _read_rules(path, seen=()):
+    spec = json.loads(path.read_text(encoding="utf-8"))
+    rewrites, triggers = [], []
+    # "extends" pulls in another rules file from the same directory, e.g. the language default.
+    parent = spec.get("extends")
+    if parent:
+        parent_path = path.parent / f"{parent}.json"
+        if parent_path in seen:
+            raise ValueError(f"Circular 'extends' in {path}")
+        rewrites, triggers = _read_rules(parent_path, seen + (path,))
+    rewrites = rewrites + [Rule(r) for r in spec.get("rewrites", [])]
+    triggers = triggers + [Rule(t) for t in spec.get("triggers", [])]
+    return rewrites, triggers
+
+
+@lru_cache(maxsize=32)
+def load_rules(code_language, fro_version, to_version):
+    """Rules for a (language, from, to) triple, or None when no rules file exists (everything goes to the LLM)."""
+    if not PREFILTER_ENABLED:
+        return None
+    for path in rules_file_candidates(code_language, fro_version, to_version):
+        if path.is_file():
+            try:
+                rewrites, triggers = _read_rules(path)
+            except (ValueError, KeyError, re.error) as e:
+                logger.error("Invalid rules file %s: %s", path, str(e))
+                return None
+            logger.info("Loaded %d rewrite and %d trigger rules from %s", len(rewrites), len(triggers), path)
+            return RuleSet(str(path), rewrites, triggers)
+    logger.info("No prefilter rules for %s %s -> %s", code_language, fro_version, to_version)
+    return None
+
+
+def classify(content, filename, rules):
+    """Apply mechanical rewrites and decide whether the (rewritten) file still needs the LLM."""
+    applied = []
+    for rule in rules.rewrites:
+        if rule.applies_to(filename):
+            content, count = rule.pattern.subn(rule.replacement, content)
+            if count:
+                applied.append(f"{rule.name} ({count}x)")
+    matched = [rule.name for rule in rules.triggers if rule.applies_to(filename) and rule.pattern.search(content)]
+    if matched:
+        action = ACTION_LLM
+    elif applied:
+        action = ACTION_REWRITE
+    else:
+        action = ACTION_COPY
+    return PrefilterDecision(action, content, matched, applied)
@@ -0,0 +1,157 @@
+import json
+import os
+import posixpath
+import logging
+from utils.rate_limiter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Step 3 reviews the migrated files in groups of neighbouring directories, then merges the group reports.
+REVIEW_GROUP_TOKEN_BUDGET = int(os.getenv("REVIEW_GROUP_TOKEN_BUDGET", "6000"))
+REVIEW_GROUP_MAX_FILES = int(os.getenv("REVIEW_GROUP_MAX_FILES", "100"))
+# Reports merged per reduce call; more reports than this are merged in rounds (at least 2, or rounds never shrink).
+REVIEW_REDUCE_FANIN = max(2, int(os.getenv("REVIEW_REDUCE_FANIN", "8")))
+
+# Starts every summary assembled without an LLM review, so it is never reused as a finished review.
+UNREVIEWED_PREFIX = "Automated review unavailable"
+
+REVIEW_CHECKLIST = """
+    - Syntax errors
+    - Annotation errors
+    - Variable naming or usage issues
+    - Any other migration mistakes
+"""
+
+
+def _entry_tokens(entry):
+    return estimate_tokens(json.dumps(entry))
+
+
+def _group_directory(paths):
+    directories = sorted({posixpath.dirname(path) or "." for path in paths})
+    common = posixpath.commonpath(directories) if "." not in directories else ""
+    if common:
+        return common
+    return ", ".join(directories[:3]) + (", ..." if len(directories) > 3 else "")
+
+
+def group_for_review(entries):
+    """Split review entries (walk order, each with a "path") into groups of whole directories where possible.
+
+    Neighbouring directories share a group until it reaches REVIEW_GROUP_TOKEN_BUDGET or REVIEW_GROUP_MAX_FILES;
+    a directory larger than that is split on its own.
+    """
+    by_directory = {}
+    for entry in entries:
+        by_directory.setdefault(posixpath.dirname(entry["path"]), []).append(entry)
+    groups = []
+    current, current_tokens = [], 0
+    for directory in sorted(by_directory):
+        files = by_directory[directory]
+        tokens = sum(_entry_tokens(entry) for entry in files)
+        fits = current_tokens + tokens <= REVIEW_GROUP_TOKEN_BUDGET and len(current) + len(files) <= REVIEW_GROUP_MAX_FILES
+        if current and not fits:
+            groups.append(current)
+            current, current_tokens = [], 0
+        for entry in files:
+            entry_tokens = _entry_tokens(entry)
+            if current and (current_tokens + entry_tokens > REVIEW_GROUP_TOKEN_BUDGET
+                            or len(current) >= REVIEW_GROUP_MAX_FILES):
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(entry)
+            current_tokens += entry_tokens
+    if current:
+        groups.append(current)
+    return [{"directory": _group_directory([entry["path"] for entry in group]), "files": group} for group in groups]
+
+
+def _review_listing(files):
+    listing = []
+    for entry in files:
+        item = {"filename": entry["filename"], "summary": entry["summary"]}
+        if entry.get("issues"):
+            item["local_validation_issues"] = entry["issues"]
+        listing.append(item)
+    return json.dumps(listing, indent=2)
+
+
+def build_group_review_prompt(group, code_language, to_version):
+    return f"""
+    STEP 3: Review Migrated Project Files (part of the project)
+
+    You are reviewing the files migrated in the `{group["directory"]}` part of a larger project for any issues,
+    including:{REVIEW_CHECKLIST}
+    Here is the list of migrated files, their summaries and any syntax problems found by local parsers:
+    {_review_listing(group["files"])}
+
+    For each file, check the migrated code for correctness and compatibility with {to_version} of {code_language}.
+    Local validation issues are definite syntax errors; include every one of them.
+    Then, provide a short report with:
+    - A list of filenames that were updated (no paths, just names)
+    - What this part of the application does after migration
+    - Any issues found and suggestions for fixes
+
+    Do NOT include any file paths in your report.
+    """
+
+
+def local_group_report(group):
+    """Report for a group whose review call failed: the file summaries and local issues, without LLM review."""
+    lines = [f"{UNREVIEWED_PREFIX} for `{group['directory']}`; file summaries:"]
+    for entry in group["files"]:
+        lines.append(f"- {entry['filename']}: {entry['summary']}")
+        lines.extend(f"  - Syntax issue: {issue}" for issue in entry.get("issues", []))
+    return "\n".join(lines)
+
+
+def build_merge_prompt(reports, code_language, to_version):
+    return f"""
+    STEP 3: Merge Review Reports
+
+    These are review reports for different parts of a project migrated to {to_version} of {code_language}:
+    {json.dumps(reports, indent=2)}
+
+    Merge them into one report with:
+    - A list of filenames that were updated (no paths, just names)
+    - What these parts of the application do after migration
+    - Every issue found and suggestions for fixes
+
+    Keep every reported issue. Do NOT include any file paths in your report.
+    """
+
+
+def build_final_review_prompt(code_language, to_version, files=None, reports=None, base_summary=None):
+    """The Step 3 prompt that produces the job summary, from the file list itself or from group reports."""
+    if reports is None:
+        material = f"""
+    You are to review the following migrated files for any issues, including:{REVIEW_CHECKLIST}
+    Here is the list of migrated files, their summaries and any syntax problems found by local parsers:
+    {_review_listing(files)}
+
+    For each file, check the migrated code for correctness and compatibility with {to_version} of {code_language}.
+    Local validation issues are definite syntax errors; include every one of them."""
+    else:
+        material = f"""
+    The migrated files were reviewed in parts; these are the review reports for each part:
+    {json.dumps(reports, indent=2)}"""
+    base_review = ""
+    if base_summary:
+        base_review = f"""
+    These files are unchanged since a previous migration and were not migrated again. The review of that previous
+    migration was:
+    {base_summary}
+
+    Merge that review with the review above into one final summary.
+    """
+    return f"""
+    STEP 3: Review Migrated Project Files
+    {material}
+    {base_review}
+    Provide a final summary with:
+    - A list of filenames that were updated (no paths, just names)
+    - An overview of the application or code after migration
+    - Any issues found and suggestions for fixes
+
+    Do NOT include any file paths in your summary.
+    """
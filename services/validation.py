@@ -0,0 +1,135 @@
+import json
+import os
+import logging
+import xml.etree.ElementTree as ET
+
+try:
+    import yaml
+except ImportError:  # PyYAML is optional; YAML files are then not checked.
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+BRACKETS = {"(": ")", "[": "]", "{": "}"}
+CLOSING = {close: open_ for open_, close in BRACKETS.items()}
+
+
+def _skip_literal(content, i, quote):
+    """Index just past the string or char literal starting at i, or -1 if the line ends first."""
+    j = i + 1
+    while j < len(content):
+        ch = content[j]
+        if ch == "\\":
+            j += 2
+            continue
+        if ch == quote:
+            return j + 1
+        if ch == "\n":
+            return -1
+        j += 1
+    return -1
+
+
+def check_java(content):
+    """Bracket balance outside comments and literals; reports the first problem only, later ones usually cascade."""
+    stack = []
+    line = 1
+    i, n = 0, len(content)
+    while i < n:
+        ch = content[i]
+        if ch == "\n":
+            line += 1
+        elif content.startswith("//", i):
+            end = content.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        elif content.startswith("/*", i):
+            end = content.find("*/", i + 2)
+            if end < 0:
+                return [f"line {line}: unterminated block comment"]
+            line += content.count("\n", i, end)
+            i = end + 2
+            continue
+        elif content.startswith('"""', i):
+            end = i + 3
+            while True:
+                end = content.find('"""', end)
+                if end < 0:
+                    return [f"line {line}: unterminated text block"]
+                if content[end - 1] != "\\":
+                    break
+                end += 1
+            line += content.count("\n", i, end)
+            i = end + 3
+            continue
+        elif ch in "\"'":
+            end = _skip_literal(content, i, ch)
+            if end < 0:
+                kind = "string" if ch == '"' else "char"
+                return [f"line {line}: unterminated {kind} literal"]
+            i = end
+            continue
+        elif ch in BRACKETS:
+            stack.append((ch, line))
+        elif ch in CLOSING:
+            if not stack:
+                return [f"line {line}: unmatched '{ch}'"]
+            opened, opened_line = stack.pop()
+            if opened != CLOSING[ch]:
+                return [f"line {line}: '{ch}' closes '{opened}' opened on line {opened_line}"]
+        i += 1
+    if stack:
+        opened, opened_line = stack[-1]
+        return [f"line {opened_line}: '{opened}' is never closed"]
+    return []
+
+
+def check_xml(content):
+    try:
+        ET.fromstring(content.encode("utf-8"))
+    except ET.ParseError as e:
+        return [f"XML parse error: {e}"]
+    return []
+
+
+def check_json(content):
+    try:
+        json.loads(content)
+    except json.JSONDecodeError as e:
+        return [f"line {e.lineno}: JSON parse error: {e.msg}"]
+    return []
+
+
+def check_yaml(content):
+    if yaml is None:
+        return []
+    try:
+        for _ in yaml.safe_load_all(content):
+            pass
+    except yaml.YAMLError as e:
+        mark = getattr(e, "problem_mark", None)
+        problem = getattr(e, "problem", None) or str(e).splitlines()[0]
+        return [f"line {mark.line + 1}: YAML parse error: {problem}" if mark else f"YAML parse error: {problem}"]
+    return []
+
+
+CHECKS = {
+    ".java": check_java,
+    ".xml": check_xml,
+    ".json": check_json,
+    ".yml": check_yaml,
+    ".yaml": check_yaml,
+}
+
+
+def validate_file(filename, content):
+    """Syntax problems found in migrated content without the LLM; files of other types are not checked."""
+    check = CHECKS.get(os.path.splitext(filename)[1].lower())
+    if check is None or content is None:
+        return []
+    try:
+        return check(content)
+    except Exception as e:
+        # A checker bug must not fail the review; the LLM still looks at the file.
+        logger.warning("Local validation of %s failed: %s", filename, str(e))
+        return []
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The repo has no package metadata; make its top-level modules importable from the tests.
+sys.path.insert(0, str(Path(__file__).parent.parent))
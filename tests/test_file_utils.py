@@ -0,0 +1,119 @@
+import zipfile
+
+import pytest
+
+from utils.file_utils import UploadRejected, safe_extract_zip
+
+
+def make_zip(path, entries, compression=zipfile.ZIP_DEFLATED):
+    with zipfile.ZipFile(path, "w", compression=compression) as zip_ref:
+        for name, data in entries:
+            zip_ref.writestr(name, data)
+    return path
+
+
+def test_extracts_regular_archive(tmp_path):
+    archive = make_zip(tmp_path / "ok.zip", [("proj/src/A.java", "class A {}\n"), ("proj/README.md", "# A\n")])
+    dest = tmp_path / "out"
+    dest.mkdir()
+
+    extracted = safe_extract_zip(archive, dest)
+
+    assert (dest / "proj/src/A.java").read_text() == "class A {}\n"
+    assert extracted == len("class A {}\n") + len("# A\n")
+
+
+@pytest.mark.parametrize("name", ["../evil.txt", "proj/../../evil.txt", "..\\evil.txt"])
+def test_rejects_zip_slip(tmp_path, name):
+    archive = make_zip(tmp_path / "slip.zip", [(name, "x")])
+    dest = tmp_path / "out"
+    dest.mkdir()
+
+    with pytest.raises(UploadRejected) as excinfo:
+        safe_extract_zip(archive, dest)
+    assert excinfo.value.status_code == 400
+    assert not (tmp_path / "evil.txt").exists()
+
+
+def test_rejects_declared_size_over_limit_before_writing(tmp_path):
+    archive = make_zip(tmp_path / "bomb.zip", [("a.txt", b"\0" * 10_000), ("b.txt", b"\0" * 10_000)])
+    dest = tmp_path / "out"
+    dest.mkdir()
+
+    with pytest.raises(UploadRejected) as excinfo:
+        safe_extract_zip(archive, dest, max_total_bytes=15_000, max_ratio=1e9)
+    assert excinfo.value.status_code == 413
+    assert list(dest.iterdir()) == []
+
+
+def test_rejects_entry_whose_declared_size_lies(tmp_path):
+    archive = make_zip(tmp_path / "liar.zip", [("a.txt", b"\0" * 50_000)])
+    # Shrink the declared size in the central directory so the declared-size check passes; zipfile then stops
+    # inflating at the declared size and the CRC check fails.
+    data = bytearray(archive.read_bytes())
+    central = data.rindex(b"PK\x01\x02")
+    data[central + 24:central + 28] = (10).to_bytes(4, "little")
+    archive.write_bytes(bytes(data))
+    dest = tmp_path / "out"
+    dest.mkdir()
+
+    with pytest.raises(UploadRejected) as excinfo:
+        safe_extract_zip(archive, dest, max_total_bytes=20_000, max_ratio=1e9, chunk_size=4096)
+    assert excinfo.value.status_code == 400
+    assert (dest / "a.txt").stat().st_size <= 20_000
+
+
+def test_rejects_high_compression_ratio(tmp_path):
+    archive = make_zip(tmp_path / "ratio.zip", [("zeros.bin", b"\0" * 3_000_000)])
+    dest = tmp_path / "out"
+    dest.mkdir()
+
+    with pytest.raises(UploadRejected) as excinfo:
+        safe_extract_zip(archive, dest, max_ratio=100, ratio_min_bytes=1_000_000, chunk_size=65536)
+    assert excinfo.value.status_code == 413
+    # Rejected on the inflated bytes, shortly after the size floor rather than at the end of the entry.
+    assert (dest / "zeros.bin").stat().st_size <= 1_000_000
+
+
+def test_accepts_small_repetitive_entry_over_ratio(tmp_path):
+    seed = "INSERT INTO users (id, name) VALUES (1, 'user');\n" * 15_000
+    archive = make_zip(tmp_path / "seed.zip", [("db/seed.sql", seed)])
+    dest = tmp_path / "out"
+    dest.mkdir()
+
+    safe_extract_zip(archive, dest, max_ratio=100, ratio_min_bytes=1_000_000)
+
+    assert (dest / "db/seed.sql").read_text() == seed
+
+
+def test_rejects_too_many_entries(tmp_path):
+    archive = make_zip(tmp_path / "many.zip", [(f"f{i}.txt", "x") for i in range(11)])
+    dest = tmp_path / "out"
+    dest.mkdir()
+
+    with pytest.raises(UploadRejected) as excinfo:
+        safe_extract_zip(archive, dest, max_entries=10)
+    assert excinfo.value.status_code == 413
+
+
+@pytest.mark.parametrize("entries", [
+    [(".", "x")],
+    [("a", "file"), ("a/b", "nested under a file")],
+])
+def test_rejects_malformed_entries(tmp_path, entries):
+    archive = make_zip(tmp_path / "bad.zip", entries)
+    dest = tmp_path / "out"
+    dest.mkdir()
+
+    with pytest.raises(UploadRejected) as excinfo:
+        safe_extract_zip(archive, dest)
+    assert excinfo.value.status_code == 400
+
+
+def test_rejects_non_zip(tmp_path):
+    archive = tmp_path / "not.zip"
+    archive.write_bytes(b"not a zip")
+
+    with pytest.raises(UploadRejected) as excinfo:
+        safe_extract_zip(archive, tmp_path)
+    assert excinfo.value.status_code == 400
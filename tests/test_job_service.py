@@ -0,0 +1,87 @@
+import pytest
+
+from services import job_service
+from services.job_service import JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+def expire_leases(monkeypatch):
+    # Every running job's heartbeat is then older than the lease.
+    monkeypatch.setattr(job_service, "JOB_LEASE_SECONDS", -1)
+
+
+def test_claims_queued_jobs_oldest_first(store):
+    store.create("a", {"filename": "a.zip"})
+    store.create("b", {"filename": "b.zip"})
+
+    first = store.claim_next("w1")
+    second = store.claim_next("w2")
+
+    assert (first["job_id"], first["status"], first["worker_id"], first["attempts"]) == ("a", JOB_RUNNING, "w1", 1)
+    assert first["params"] == {"filename": "a.zip"}
+    assert second["job_id"] == "b"
+    assert store.claim_next("w3") is None
+
+
+def test_reclaims_job_after_lease_expires(store, monkeypatch):
+    store.create("a", {})
+    store.claim_next("w1")
+    assert store.claim_next("w2") is None
+
+    expire_leases(monkeypatch)
+    job = store.claim_next("w2")
+
+    assert (job["job_id"], job["worker_id"], job["attempts"]) == ("a", "w2", 2)
+
+
+def test_worker_that_lost_its_lease_cannot_finish_the_job(store, monkeypatch):
+    store.create("a", {})
+    store.claim_next("w1")
+    expire_leases(monkeypatch)
+    store.claim_next("w2")
+
+    assert store.complete("a", "w1", {"summary": "stale"}) is False
+    assert store.fail("a", "w1", "stale") is False
+    assert store.get("a")["status"] == JOB_RUNNING
+
+    assert store.complete("a", "w2", {"summary": "ok"}) is True
+    job = store.get("a")
+    assert (job["status"], job["result"]) == (JOB_COMPLETED, {"summary": "ok"})
+
+
+def test_release_gives_the_attempt_back(store):
+    store.create("a", {})
+    for _ in range(job_service.JOB_MAX_ATTEMPTS + 2):
+        job = store.claim_next("w1")
+        assert job["attempts"] == 1
+        store.release("a", "w1")
+        job = store.get("a")
+        assert (job["status"], job["worker_id"], job["attempts"]) == (JOB_QUEUED, None, 0)
+
+
+def test_release_by_another_worker_is_ignored(store):
+    store.create("a", {})
+    store.claim_next("w1")
+
+    store.release("a", "w2")
+
+    assert store.get("a")["status"] == JOB_RUNNING
+    assert store.get_events("a")[-1][1]["status"] == JOB_RUNNING
+
+
+def test_gives_up_after_max_attempts(store, monkeypatch):
+    monkeypatch.setattr(job_service, "JOB_MAX_ATTEMPTS", 2)
+    expire_leases(monkeypatch)
+    store.create("a", {})
+    assert store.claim_next("w1")["attempts"] == 1
+    assert store.claim_next("w2")["attempts"] == 2
+
+    assert store.claim_next("w3") is None
+
+    job = store.get("a")
+    assert (job["status"], job["error"]) == (JOB_FAILED, "Gave up after 2 attempt(s)")
+    assert store.get_events("a")[-1][1] == {"type": "job", "status": JOB_FAILED, "error": "Gave up after 2 attempt(s)"}
@@ -0,0 +1,37 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrent blocking filesystem calls issued from request handlers and jobs.
+FILE_IO_WORKERS = int(os.getenv("FILE_IO_WORKERS", "8"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_io_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FILE_IO_WORKERS, thread_name_prefix="file-io")
+            logger.info("File I/O pool started with %d workers", FILE_IO_WORKERS)
+    return _executor
+
+
+async def run_io(func, *args, **kwargs):
+    """Run a blocking filesystem call on the dedicated I/O pool instead of the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_io_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
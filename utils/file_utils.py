@@ -1,10 +1,111 @@
 import os
+import hashlib
 import logging
-from pathlib import Path
+import shutil
+import zipfile
+import zlib
+from pathlib import Path, PurePosixPath
 from fastapi.responses import FileResponse
+from utils.async_fs import run_io
 
 logger = logging.getLogger(__name__)
 
+DOWNLOADS_ROOT = Path(__file__).parent.parent / "resources/downloads"
+ARCHIVES_ROOT = Path(__file__).parent.parent / "resources/archives"
+
+# Formats that are already compressed; deflating them again only costs CPU.
+STORED_EXTENSIONS = {
+    '.zip', '.jar', '.war', '.ear', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst',
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.mp3', '.mp4', '.mov', '.pdf', '.woff', '.woff2',
+}
+
+# Upload ingestion limits
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+MAX_EXTRACTED_BYTES = int(os.getenv("MAX_EXTRACTED_BYTES", str(4 * 1024 * 1024 * 1024)))
+MAX_ZIP_ENTRIES = int(os.getenv("MAX_ZIP_ENTRIES", "20000"))
+MAX_COMPRESSION_RATIO = float(os.getenv("MAX_COMPRESSION_RATIO", "100"))
+# Small repetitive files (SQL seeds, fixed-width data, SVG) compress far beyond the ratio limit; only entries that
+# inflate past this many bytes are held to it.
+COMPRESSION_RATIO_MIN_BYTES = int(os.getenv("COMPRESSION_RATIO_MIN_BYTES", str(1024 * 1024)))
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+async def spool_upload(file, dest_path, max_bytes=MAX_UPLOAD_BYTES, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Copy an UploadFile to dest_path in fixed-size chunks, rejecting it once it exceeds max_bytes."""
+    written = 0
+    out = await run_io(open, dest_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise UploadRejected(f"Upload exceeds the {max_bytes} byte limit", status_code=413)
+            await run_io(out.write, chunk)
+    finally:
+        await run_io(out.close)
+    logger.info("Spooled %d bytes to %s", written, dest_path)
+    return written
+
+
+def safe_extract_zip(zip_path, dest_dir, max_total_bytes=MAX_EXTRACTED_BYTES, max_entries=MAX_ZIP_ENTRIES,
+                     max_ratio=MAX_COMPRESSION_RATIO, ratio_min_bytes=COMPRESSION_RATIO_MIN_BYTES,
+                     chunk_size=UPLOAD_CHUNK_SIZE):
+    """Extract zip_path entry by entry, enforcing entry count, total size and compression ratio limits.
+
+    The ratio limit applies to entries that inflate past ratio_min_bytes.
+    """
+    dest_root = Path(dest_dir).resolve()
+    try:
+        zip_ref = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile as e:
+        raise UploadRejected(f"Invalid zip archive: {e}")
+    with zip_ref:
+        entries = zip_ref.infolist()
+        if len(entries) > max_entries:
+            raise UploadRejected(f"Zip has {len(entries)} entries, limit is {max_entries}", status_code=413)
+        # Check the declared sizes first so obvious bombs are rejected before anything is written.
+        declared = sum(info.file_size for info in entries)
+        if declared > max_total_bytes:
+            raise UploadRejected(f"Zip expands to {declared} bytes, limit is {max_total_bytes}", status_code=413)
+        extracted = 0
+        for info in entries:
+            target = (dest_root / PurePosixPath(info.filename.replace("\\", "/"))).resolve()
+            if not target.is_relative_to(dest_root):
+                raise UploadRejected(f"Zip entry escapes the upload directory: {info.filename}")
+            try:
+                if info.is_dir():
+                    target.mkdir(parents=True, exist_ok=True)
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                # Declared sizes can lie, so the limits are enforced on the bytes actually inflated.
+                entry_bytes = 0
+                with zip_ref.open(info) as src, open(target, "wb") as dst:
+                    while True:
+                        chunk = src.read(chunk_size)
+                        if not chunk:
+                            break
+                        extracted += len(chunk)
+                        entry_bytes += len(chunk)
+                        if extracted > max_total_bytes:
+                            raise UploadRejected(f"Zip expands beyond {max_total_bytes} bytes", status_code=413)
+                        if entry_bytes > ratio_min_bytes and entry_bytes / max(info.compress_size, 1) > max_ratio:
+                            raise UploadRejected(f"Suspicious compression ratio for {info.filename}", status_code=413)
+                        dst.write(chunk)
+            except (OSError, EOFError, zipfile.BadZipFile, zlib.error) as e:
+                # Malformed archives: an entry named "." or a file that is also a directory ("a" and "a/b"),
+                # or corrupt data (bad CRC, truncated stream).
+                raise UploadRejected(f"Cannot extract zip entry {info.filename}: {e}")
+    logger.info("Extracted %d entries (%d bytes) to %s", len(entries), extracted, dest_dir)
+    return extracted
+
 def save_uploads(files):
     uploads_dir = Path(__file__).parent.parent / "resources/uploads"
     downloads_dir = Path(__file__).parent.parent / "resources/downloads"
@@ -13,16 +114,70 @@ def save_uploads(files):
     for file in files:
         file_path = uploads_dir / (file.filename.replace("\\", "/"))
         file_path.parent.mkdir(parents=True, exist_ok=True)
-        content = file.file.read()
-        try:
-            file_path.write_text(content.decode("utf-8"))
-            logger.info("Saved text file: %s", file_path)
-        except Exception:
-            file_path.write_bytes(content)
-            logger.info("Saved binary file: %s", file_path)
+        # The previous upload of this path may be hard-linked into a download; replace it instead of truncating.
+        file_path.unlink(missing_ok=True)
+        with open(file_path, "wb") as out:
+            shutil.copyfileobj(file.file, out, UPLOAD_CHUNK_SIZE)
+        logger.info("Saved file: %s", file_path)
     logger.info("All files saved to %s", uploads_dir)
     return str(uploads_dir), str(downloads_dir)
 
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def link_or_copy(src, dst):
+    """Hard-link src to dst (sharing the data blocks), falling back to a copy across filesystems.
+
+    shutil.copyfile copies in the kernel (sendfile) on Linux, so neither path moves file data through Python.
+    """
+    Path(dst).unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def scan_tree(src_dir, dst_dir):
+    """Walk src_dir in sorted order, mirror its directories under dst_dir and hash every file.
+
+    Returns (src_file, dst_file, rel_path, source_hash) tuples in walk order.
+    """
+    entries = []
+    for root, dirs, files in os.walk(src_dir):
+        dirs.sort()
+        rel_dir = os.path.relpath(root, src_dir)
+        target_dir = os.path.join(dst_dir, rel_dir) if rel_dir != '.' else dst_dir
+        os.makedirs(target_dir, exist_ok=True)
+        for file in sorted(files):
+            src_file = os.path.join(root, file)
+            rel_path = os.path.relpath(src_file, src_dir).replace("\\", "/")
+            entries.append((src_file, os.path.join(target_dir, file), rel_path, hash_file(src_file)))
+    return entries
+
+def fingerprint_hashes(entries):
+    """Fingerprint of (rel_path, content_hash) pairs given in sorted walk order."""
+    digest = hashlib.sha256()
+    for rel_path, content_hash in entries:
+        digest.update(rel_path.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(content_hash.encode("ascii"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+def fingerprint_directory(directory):
+    """Hash of every file's relative path and content under directory, independent of walk order."""
+    entries = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            rel_path = os.path.relpath(file_path, directory).replace("\\", "/")
+            entries.append((rel_path, hash_file(file_path)))
+    return fingerprint_hashes(entries)
+
 def prepare_download_links(downloads_dir):
     links = []
     for root, dirs, files in os.walk(downloads_dir):
@@ -33,19 +188,46 @@ def prepare_download_links(downloads_dir):
     logger.info("Prepared %d download links for %s", len(links), downloads_dir)
     return links
 
-def zip_downloads(downloads_dir, filename):
-    import shutil
+def zip_downloads(downloads_dir, filename, job_id=None):
+    """Build the job's project archive once, in a single pass over its downloads, and return its path.
+
+    Archives live in ARCHIVES_ROOT/<job_id>/, outside the downloads tree, so they never end up inside each other.
+    """
     downloads_dir_path = Path(downloads_dir)
-    zip_path = downloads_dir_path.parent / f"{filename}.zip"
-    if zip_path.exists():
-        zip_path.unlink()
-        logger.info("Removed existing zip: %s", zip_path)
-    shutil.make_archive(str(zip_path.with_suffix('')), 'zip', str(downloads_dir_path))
+    archive_dir = ARCHIVES_ROOT / (job_id or downloads_dir_path.name)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    zip_path = archive_dir / f"{Path(filename).stem or 'project'}.zip"
+    tmp_path = zip_path.with_name(zip_path.name + ".part")
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zip_ref:
+        for root, dirs, files in os.walk(downloads_dir_path):
+            dirs.sort()
+            for file in sorted(files):
+                file_path = os.path.join(root, file)
+                arcname = os.path.relpath(file_path, downloads_dir_path)
+                stored = os.path.splitext(file.lower())[1] in STORED_EXTENSIONS
+                zip_ref.write(file_path, arcname, compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+    for stale in archive_dir.glob("*.zip"):
+        if stale != zip_path:
+            stale.unlink()
+            logger.info("Removed stale archive: %s", stale)
+    # Publish atomically so a concurrent download never sees a half-written archive.
+    os.replace(tmp_path, zip_path)
     logger.info("Created zip archive: %s", zip_path)
+    return zip_path
+
+def get_project_archive(job_id):
+    archives_root = ARCHIVES_ROOT.resolve()
+    archive_dir = (archives_root / job_id).resolve()
+    if archive_dir.parent != archives_root or not archive_dir.is_dir():
+        return None
+    archives = sorted(archive_dir.glob("*.zip"))
+    return archives[0] if archives else None
 
 def get_file_from_downloads(filename):
-    file_path = Path(filename)
-    if not file_path.exists():
+    downloads_root = DOWNLOADS_ROOT.resolve()
+    file_path = (downloads_root / filename).resolve()
+    # Only serve files that live under the downloads root.
+    if not file_path.is_relative_to(downloads_root) or not file_path.is_file():
         logger.warning("Requested file not found: %s", file_path)
         return None
     logger.info("Serving file from downloads: %s", file_path)
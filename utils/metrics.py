@@ -0,0 +1,220 @@
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Per-job span list cap; totals keep counting past it.
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "5000"))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            key = self._key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        # For counters maintained elsewhere (e.g. cache hit counts) and mirrored at scrape time.
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        with self._lock:
+            key = self._key(labels)
+            if key not in self._values:
+                self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            state = self._values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["buckets"]):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else repr(float(bound))
+                    samples.append((f"{self.name}_bucket", key, (("le", le),), cumulative))
+                samples.append((f"{self.name}_sum", key, (), state["sum"]))
+                samples.append((f"{self.name}_count", key, (), state["count"]))
+        return samples
+
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "migration_stage_seconds", "Duration of job stages (upload, analysis steps, file migration, review, zip).",
+    ["stage"]
+)
+
+
+class Trace:
+    """Timing spans recorded for one job; to_dict() is attached to the job result."""
+
+    def __init__(self, spans=None):
+        self._lock = threading.Lock()
+        self.spans = list(spans or [])
+        self.totals = defaultdict(lambda: defaultdict(float))
+        for span_record in self.spans:
+            self._accumulate(span_record)
+        self.dropped = 0
+
+    def _accumulate(self, span_record):
+        totals = self.totals[span_record["name"]]
+        totals["count"] += 1
+        totals["seconds"] += span_record["seconds"]
+        totals["max_seconds"] = max(totals["max_seconds"], span_record["seconds"])
+        for key, value in span_record.items():
+            if key not in ("seconds", "started_at") and isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[key] += value
+
+    def add(self, name, seconds, started_at=None, **attrs):
+        span_record = {
+            "name": name,
+            "started_at": round(started_at if started_at is not None else time.time() - seconds, 3),
+            "seconds": round(seconds, 4),
+            **attrs,
+        }
+        with self._lock:
+            self._accumulate(span_record)
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append(span_record)
+            else:
+                self.dropped += 1
+
+    def to_dict(self):
+        with self._lock:
+            totals = {name: {key: round(value, 4) for key, value in values.items()} for name, values in self.totals.items()}
+            return {"spans": list(self.spans), "totals": totals, "dropped_spans": self.dropped}
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace):
+    """Record spans from this context (and the asyncio tasks it starts) into trace."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block as a job stage; the yielded dict can be filled with extra attributes for the span."""
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=name)
+        trace = current_trace()
+        if trace is not None:
+            trace.add(name, seconds, started_at=started_at, **attrs)
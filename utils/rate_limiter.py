@@ -0,0 +1,59 @@
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    # Rough heuristic (~4 characters per token) good enough for budgeting.
+    return max(1, len(text) // 4)
+
+
+class RateLimiter:
+    """Sliding one-minute window limiter for requests and tokens per minute.
+
+    A limit of 0 (or less) disables that dimension.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, window=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._events = []  # (timestamp, tokens)
+        self._lock = asyncio.Lock()
+
+    def _prune(self, now):
+        cutoff = now - self.window
+        while self._events and self._events[0][0] <= cutoff:
+            self._events.pop(0)
+
+    def _wait_time(self, now, tokens):
+        self._prune(now)
+        waits = [0.0]
+        if self.requests_per_minute > 0 and len(self._events) >= self.requests_per_minute:
+            waits.append(self._events[-self.requests_per_minute][0] + self.window - now)
+        if self.tokens_per_minute > 0 and self._events:
+            used = sum(t for _, t in self._events)
+            # A single request larger than the whole budget is let through once the window is empty.
+            if used + tokens > self.tokens_per_minute:
+                freed = 0
+                for ts, t in self._events:
+                    freed += t
+                    if used - freed + tokens <= self.tokens_per_minute:
+                        waits.append(ts + self.window - now)
+                        break
+                else:
+                    waits.append(self._events[-1][0] + self.window - now)
+        return max(waits)
+
+    async def acquire(self, tokens=1):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    self._events.append((now, tokens))
+                    return
+                logger.info("Rate limit reached, waiting %.2fs", wait)
+                await asyncio.sleep(wait)